@@ -17,8 +17,11 @@ elif env_path.exists():
 else:
     load_dotenv()
 
+from profiling import register_profiling  # after load_dotenv: reads ADMIN_TOKEN
+
 app = Flask(__name__)
 CORS(app)
+register_profiling(app)
 
 # Initialize Letta client (will be configured with API key)
 try:
@@ -81,7 +84,7 @@ Adjust your tone based on confidence: high confidence = direct and urgent, low c
         import requests
 
         # Get the base URL and token
-        base_url = "https://api.letta.com"  # or your custom Letta server URL
+        base_url = os.environ.get("LETTA_BASE_URL", "https://api.letta.com")  # or your custom Letta server URL
         api_key = os.environ.get("LETTA_API_KEY")
 
         # Make direct API call to send message
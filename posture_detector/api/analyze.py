@@ -0,0 +1,109 @@
+"""
+Helpers for the fused /api/analyze endpoint in get_metrics.py.
+
+The browser used to make four sequential round trips per frame: upload to
+Next.js, metrics from :5500, logging to :3500 and, on bad posture, feedback
+from :5001. /api/analyze takes the frame once and does the rest server-side:
+
+    store_frame      keeps storage/sessions/{session}/frames/ as before
+    record_sample    posts the sample to the dashboard service (log_posture +
+                     socket emit) on a background thread, off the response path
+    request_feedback asks the feedback service and falls back to the local
+                     rule table (feedback_rules) when it is unreachable
+"""
+
+import base64
+import json
+import os
+import re
+import threading
+import urllib.request
+
+from storage_lifecycle import SESSIONS_DIR
+
+DASHBOARD_URL = os.environ.get("DASHBOARD_URL", "http://localhost:3500")
+FEEDBACK_URL = os.environ.get("FEEDBACK_URL", "http://localhost:5001")
+SERVICE_TIMEOUT_SECONDS = float(os.environ.get("SERVICE_TIMEOUT_SECONDS", "10"))
+
+# "auto": bad posture that just changed; "bad": any bad posture; "never"
+FEEDBACK_MODES = ("auto", "bad", "never")
+
+
+def safe_name(value):
+    """A single path component; ValueError for names that could leave the parent directory."""
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(value))[:128]
+    # "." and ".." would resolve outside storage/sessions; dot-names are hidden anyway
+    if not name or name.startswith("."):
+        raise ValueError(f"invalid name: {value!r}")
+    return name
+
+
+def decode_frame_data(frame_data):
+    """Bytes from a base64 string, with or without a data: URL prefix."""
+    if "," in frame_data[:64]:
+        frame_data = frame_data.split(",", 1)[1]
+    return base64.b64decode(frame_data)
+
+
+def store_frame(session_id, frame_number, data):
+    """Write the JPEG where the upload-frame route would; returns its path."""
+    session_dir = SESSIONS_DIR / safe_name(session_id)
+    if session_dir.resolve().parent != SESSIONS_DIR.resolve():
+        raise ValueError(f"invalid session id: {session_id!r}")
+    frames_dir = session_dir / "frames"
+    frames_dir.mkdir(parents=True, exist_ok=True)
+    path = frames_dir / f"frame_{int(frame_number):06d}.jpg"
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return path
+
+
+def _post_json(url, payload, timeout=SERVICE_TIMEOUT_SECONDS):
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def record_sample(metrics, user=None):
+    """Log the sample on the dashboard service without blocking the caller."""
+    payload = {
+        "neck_strain": metrics["neck_strain"],
+        "eye_strain": metrics["eye_strain"],
+        "posture": metrics["posture"],
+    }
+    if user:
+        payload["user"] = user
+
+    def _run():
+        try:
+            _post_json(f"{DASHBOARD_URL}/api/app.py", payload)
+        except Exception as e:
+            print(f"[ANALYZE] Posture logging failed (non-critical): {e}")
+
+    threading.Thread(target=_run, name="record-sample", daemon=True).start()
+
+
+def wants_feedback(metrics, mode):
+    if mode == "never" or metrics.get("posture") != 0:
+        return False
+    if mode == "bad":
+        return True
+    return metrics.get("posture_changed", True) is not False
+
+
+def request_feedback(metrics):
+    """(feedback text, source) with source "service" or "rules"."""
+    try:
+        data = _post_json(f"{FEEDBACK_URL}/api/ai_feedback", metrics)
+        if data.get("feedback"):
+            return data["feedback"], "service"
+    except Exception as e:
+        print(f"[ANALYZE] Feedback service unavailable, using rules: {e}")
+    from feedback_rules import score_records
+    return score_records([metrics])[0]["feedback"], "rules"
@@ -2,12 +2,17 @@ import eventlet
 eventlet.monkey_patch()
 import ast
 
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+from flask import Flask, render_template, request, jsonify, make_response
+from flask_socketio import SocketIO, join_room
 from flask_cors import CORS
-import os, re, time, threading, json, logging
-from datetime import datetime
+import os, time, threading, json, hashlib, socket
+import urllib.parse
+from datetime import datetime, timezone
 from pathlib import Path
+from storage_lifecycle import disk_usage, start_lifecycle_thread, STORAGE_LIFECYCLE
+from fanout import socketio_options, normalize_user, user_room, ALL_USERS, DEFAULT_USER
+from export import LOG_PATTERN
+from profiling import register_profiling
 
 BASE_DIR = Path(__file__).parent
 LOG_DIR = BASE_DIR / "logs"
@@ -19,28 +24,34 @@ app = Flask(
     static_folder=str(BASE_DIR / "static")
 )
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+register_profiling(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", **socketio_options())
 
-timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-LOG_FILE = LOG_DIR / f"posture_{timestamp_str}.log"
+# Samples go to posture_{day}_{user}_{node}.log: processes sharing LOG_DIR never
+# append to the same file, and every view reads all files for its day and user,
+# whichever node wrote them. Older posture_{day}_{HH-MM-SS}.log files (one per
+# run, all users mixed) are still read.
+NODE_ID = f"{socket.gethostname()}-{os.getpid()}".replace("_", "-")
+_log_lock = threading.Lock()
 
-logger = logging.getLogger("posture_data")
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8")
-formatter = logging.Formatter("%(asctime)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
+def log_path(day, user):
+    return LOG_DIR / f"posture_{day}_{user}_{NODE_ID}.log"
 
-def log_posture(status: str, neck_strain: float, eye_strain: float, posture: int):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def log_posture(status: str, neck_strain: float, eye_strain: float, posture: int, user: str = DEFAULT_USER):
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     log_line = (
-        f"user=system posture_status={status} posture={posture} "
+        f"user={user} posture_status={status} posture={posture} "
         f"neck_strain={neck_strain:.2f} eye_strain={eye_strain:.2f}"
     )
-    logger.info(log_line)
+    with _log_lock:
+        with open(log_path(now.strftime("%Y-%m-%d"), user), "a", encoding="utf-8") as f:
+            f.write(f"{timestamp},{now.microsecond // 1000:03d} - {log_line}\n")
     return {
         "timestamp": timestamp,
+        "user": user,
         "status": status,
         "posture": posture,
         "neck_strain": neck_strain,
@@ -48,19 +59,46 @@ def log_posture(status: str, neck_strain: float, eye_strain: float, posture: int
     }
 
 
-def get_latest_log():
-    files = [LOG_DIR / f for f in os.listdir(LOG_DIR) if f.startswith("posture_") and f.endswith(".log")]
-    return max(files, key=os.path.getctime) if files else None
+def log_owner(name):
+    """User a posture_*.log belongs to, or None for a legacy all-users log."""
+    rest = name[len("posture_YYYY-MM-DD_"):-len(".log")]
+    return rest.rsplit("_", 1)[0] if "_" in rest else None
+
+
+def view_logs(user=None):
+    """(day, [paths]): every log of the latest day with samples for `user` (None = all users)."""
+    by_day = {}
+    for entry in os.scandir(LOG_DIR):
+        name = entry.name
+        if not (name.startswith("posture_") and name.endswith(".log")):
+            continue
+        owner = log_owner(name)
+        if user is not None and owner is not None and owner != user:
+            continue
+        by_day.setdefault(name[len("posture_"):len("posture_YYYY-MM-DD")], []).append(Path(entry.path))
+    if not by_day:
+        return None, []
+    day = max(by_day)
+    return day, sorted(by_day[day])
+
+
+# path -> (mtime_ns, size, entries); logs only grow, so a changed stat means re-read
+_parsed = {}
+
+
+def parse_log_cached(path):
+    st = path.stat()
+    cached = _parsed.get(path)
+    if cached is None or cached[:2] != (st.st_mtime_ns, st.st_size):
+        cached = _parsed[path] = (st.st_mtime_ns, st.st_size, parse_log(path))
+    return cached[2]
 
 
 def parse_log(path):
-    pattern = re.compile(
-        r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ - user=(\w+) posture_status=(\w+) posture=(\d+) neck_strain=([\d.]+) eye_strain=([\d.]+)"
-    )
     entries = []
     with open(path, encoding="utf-8") as f:
         for line in f:
-            m = pattern.search(line)
+            m = LOG_PATTERN.search(line)
             if m:
                 t, u, s, p, n, e = m.groups()
                 entries.append({
@@ -74,11 +112,7 @@ def parse_log(path):
     return entries
 
 
-def get_dashboard_data():
-    log = get_latest_log()
-    if not log:
-        return None
-    entries = parse_log(log)
+def build_dashboard_data(day, entries):
     ts = [e["timestamp"] for e in entries]
     neck = [e["neck_strain"] for e in entries]
     eye = [e["eye_strain"] for e in entries]
@@ -95,7 +129,7 @@ def get_dashboard_data():
     accuracy = percentages[-1] if percentages else 0.0  # last rolling % for display
 
     return {
-        "log_name": log.name,
+        "log_name": day,
         "entries": entries[-50:],
         "timestamps": ts[-50:],
         "neck_strain": neck[-50:],
@@ -107,13 +141,86 @@ def get_dashboard_data():
     }
 
 
+# Dashboard views (user None = all users), rebuilt only when one of their logs changes
+_views = {}
+_snapshot_lock = threading.Lock()
+
+
+def get_dashboard_snapshot(user=None):
+    """
+    {"data", "etag", "last_modified", "html"} for the latest day, or None.
+
+    A view covers every log of that day from every node. It is keyed by
+    (path, mtime, size) of those logs; each file is parsed once per version,
+    and page hits, socket emits and the watcher all share the result.
+    """
+    day, logs = view_logs(user)
+    if not logs:
+        return None
+    stats = [(log, log.stat()) for log in logs]
+    key = (day, tuple((str(log), st.st_mtime_ns, st.st_size) for log, st in stats))
+    view = _views.get(user)
+    if view is None or view["key"] != key:
+        with _snapshot_lock:
+            view = _views.get(user)
+            if view is None or view["key"] != key:
+                entries = [e for log in logs for e in parse_log_cached(log)]
+                if user is not None:
+                    entries = [e for e in entries if e["user"] == user]
+                entries.sort(key=lambda e: e["timestamp"])
+                view = _views[user] = {
+                    "key": key,
+                    "data": build_dashboard_data(day, entries),
+                    "etag": hashlib.sha1(repr((key, user)).encode()).hexdigest()[:16],
+                    "last_modified": datetime.fromtimestamp(max(st.st_mtime for _, st in stats), tz=timezone.utc),
+                    "html": {},
+                }
+                # Drop parses of logs that are no longer part of any view
+                live = {log for v in _views.values() for log, *_ in v["key"][1]}
+                for path in [p for p in _parsed if str(p) not in live]:
+                    del _parsed[path]
+    return view
+
+
+def get_dashboard_data(user=None):
+    snapshot = get_dashboard_snapshot(user)
+    return snapshot["data"] if snapshot else None
+
+
+def render_dashboard(snapshot, user=None):
+    # Re-render if the template itself changes (debug edits)
+    template_version = os.stat(BASE_DIR / "templates" / "dashboard.html").st_mtime_ns
+    html = snapshot["html"].get(template_version)
+    if html is None:
+        html = snapshot["html"][template_version] = render_template(
+            "dashboard.html", **snapshot["data"], dashboard_user=user)
+    return html, f"{snapshot['etag']}-{template_version:x}"
+
+
+def conditional_response(response, etag, last_modified):
+    """Attach validators and turn the response into a 304 if the client copy is current."""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 
 @app.route("/")
 def dashboard():
-    data = get_dashboard_data()
-    if not data:
+    user = normalize_user(request.args.get("user"))
+    snapshot = get_dashboard_snapshot(user)
+    if not snapshot:
         return "<h2>No log files found in /logs directory.</h2>"
-    return render_template("dashboard.html", **data)
+    html, etag = render_dashboard(snapshot, user)
+    return conditional_response(make_response(html), etag, snapshot["last_modified"])
+
+
+@app.route("/api/dashboard", methods=["GET"])
+def dashboard_snapshot():
+    snapshot = get_dashboard_snapshot(normalize_user(request.args.get("user")))
+    if not snapshot:
+        return jsonify({"error": "No log files found"}), 404
+    return conditional_response(jsonify(snapshot["data"]), snapshot["etag"], snapshot["last_modified"])
 
 
 
@@ -229,12 +336,13 @@ def api_log():
         eye = safe_float(data.get("eye-strain") or data.get("eye_strain") or 0)
         posture = safe_int(data.get("posture") or 0)
         status = "correct" if posture == 1 else "incorrect"
+        user = normalize_user(data.get("user")) or DEFAULT_USER
 
         # --------------------------
         # 6️⃣ Log and emit
         # --------------------------
-        result = log_posture(status, neck, eye, posture)
-        socketio.emit("update", get_dashboard_data())
+        result = log_posture(status, neck, eye, posture, user)
+        emit_update(user)
         print(f"[API] Logged {status.upper()} → neck={neck:.2f}, eye={eye:.2f}, posture={posture}")
 
         return jsonify(result)
@@ -243,28 +351,61 @@ def api_log():
         print("[FATAL API ERROR]", e)
         return jsonify({"error": str(e)}), 500
 
+# Dashboard subscriptions held by this process: sid -> user (ALL_USERS for the combined view)
+_subscribers = {}
+
+
+@socketio.on("connect")
+def on_dashboard_connect(auth=None):
+    user = normalize_user(request.args.get("user")) or ALL_USERS
+    join_room(user_room(user))
+    _subscribers[request.sid] = user
+
+
+@socketio.on("disconnect")
+def on_dashboard_disconnect(*args):
+    _subscribers.pop(request.sid, None)
+
+
+def emit_update(user):
+    """Send a new sample's views to that user's room and the combined room, on every node."""
+    for view_user, room in ((None, ALL_USERS), (user, user)):
+        data = get_dashboard_data(view_user)
+        if data:
+            socketio.emit("update", data, to=user_room(room))
+
+
 def watch_logs():
     last_state = None
     while True:
-        log = get_latest_log()
-        if not log:
-            time.sleep(2)
-            continue
         try:
-            content = open(log, encoding="utf-8").read()
-            if content != last_state:
-                last_state = content
-                data = get_dashboard_data()
-                if data:
-                    socketio.emit("update", data)
-                    print(f"[SOCKET] Update sent: {data['log_name']}")
+            snapshot = get_dashboard_snapshot()
+            if not snapshot:
+                time.sleep(2)
+                continue
+            if snapshot["etag"] != last_state:
+                last_state = snapshot["etag"]
+                # Any node's sample (shared LOG_DIR): refresh only the rooms this node serves
+                for user in set(_subscribers.values()):
+                    data = get_dashboard_data(None if user == ALL_USERS else user)
+                    if data:
+                        socketio.emit("update", data, to=user_room(user), ignore_queue=True)
+                print(f"[SOCKET] Update sent: {snapshot['data']['log_name']}")
         except Exception as e:
             print("Watcher error:", e)
         time.sleep(2)
 
 
+@app.route("/api/storage", methods=["GET"])
+def storage_report():
+    return jsonify(disk_usage())
+
+
 threading.Thread(target=watch_logs, daemon=True).start()
 
 if __name__ == "__main__":
+    if STORAGE_LIFECYCLE:
+        start_lifecycle_thread()
+        print("🧹 Storage retention sweeper running")
     print("✅ Server starting with Eventlet on http://localhost:3500")
     socketio.run(app, host="0.0.0.0", port=3500, debug=True, use_reloader=False)
@@ -0,0 +1,227 @@
+"""
+Pick torch threads, model input size and segmentation batch size for this machine.
+
+    python autotune.py --slo-ms 1500            # tune with the real models, save autotune.json
+    python autotune.py --stand-in --slo-ms 200  # offline stand-ins (testing the tuner)
+    python autotune.py --show                   # print the saved config
+
+Every combination in the grid runs the depth and face-parsing models on
+synthetic frames. A round of b frames is b depth passes, one segmentation
+batch of b and b upsample/argmax passes. Its wall time is how long the last
+of b simultaneous frames waits. A configuration meets the SLO when its p90
+round time fits in --slo-ms. Among those, the largest input scale wins, since
+detail is what the SLO buys, and then the highest frame rate. If nothing
+meets the SLO, the fastest configuration is saved and flagged.
+
+The result is stored in autotune.json with a fingerprint of the CPU, the
+torch version and the model ids. warm_up() applies it at startup, and an
+explicit OMP_NUM_THREADS, INPUT_SCALE or SEGMENTATION_MAX_BATCH still wins.
+Prefork workers and replay workers pin their own thread counts. With
+AUTOTUNE=auto the service tunes during warm-up when nothing matching is
+saved; AUTOTUNE=off ignores the file. Under prefork the parent never tunes
+(inference before fork isn't safe); each worker applies the saved config.
+"""
+
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+API_DIR = Path(__file__).resolve().parent
+AUTOTUNE_PATH = Path(os.environ.get("AUTOTUNE_PATH", API_DIR / "autotune.json"))
+AUTOTUNE = os.environ.get("AUTOTUNE", "load")  # off | load | auto
+AUTOTUNE_SLO_MS = float(os.environ.get("AUTOTUNE_SLO_MS", "1500"))
+INPUT_SCALES = (1.0, 0.85, 0.7)
+BATCH_SIZES = (1, 2, 4)
+FRAME_SIZE = (640, 480)
+ROUNDS = 3
+SEED = 1234
+
+# Setting -> env var that overrides a saved value
+ENV_OVERRIDES = {
+    "threads": "OMP_NUM_THREADS",
+    "input_scale": "INPUT_SCALE",
+    "segmentation_max_batch": "SEGMENTATION_MAX_BATCH",
+}
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def fingerprint(stand_in=False):
+    """What a saved config is only valid for."""
+    import get_depth
+    get_depth.load_backend()
+    return {
+        "cpu": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "torch": get_depth.torch.__version__,
+        "depth_model": get_depth.DEPTH_MODEL_ID,
+        "face_parsing_model": get_depth.FACE_PARSING_MODEL_ID,
+        "stand_in": stand_in,
+    }
+
+
+def thread_counts(cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return sorted({max(1, cpu_count // 4), max(1, cpu_count // 2), cpu_count})
+
+
+def _frames(count):
+    from benchmark import synthetic_frame
+    from frame_cache import DecodedFrame
+    rng = np.random.default_rng(SEED)
+    return [DecodedFrame(f"autotune:{i}", synthetic_frame(rng, *FRAME_SIZE)) for i in range(count)]
+
+
+def _round(frames):
+    import get_depth
+    for frame in frames:
+        get_depth.get_depth(None, frame, save_artifacts=False)
+    logits = get_depth.segment_batch(frames)
+    with get_depth.torch.inference_mode():
+        for frame, frame_logits in zip(frames, logits):
+            get_depth.upsample_labels(frame_logits, frame.size[::-1])
+
+
+def measure(config, frames, rounds=ROUNDS):
+    """Time `rounds` rounds of config["segmentation_max_batch"] frames after one warm-up round."""
+    import get_depth
+    get_depth.configure_inference(**config)
+    batch = frames[:config["segmentation_max_batch"]]
+    _round(batch)
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _round(batch)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        **config,
+        "p50_ms": round(float(np.percentile(times, 50)), 1),
+        "p90_ms": round(float(np.percentile(times, 90)), 1),
+        "frames_per_sec": round(len(batch) * len(times) / (times.sum() / 1000), 3),
+    }
+
+
+def choose(results, slo_ms):
+    """Largest input scale within the SLO, then highest throughput; else the fastest."""
+    within = [r for r in results if r["p90_ms"] <= slo_ms]
+    if within:
+        return max(within, key=lambda r: (r["input_scale"], r["frames_per_sec"])), True
+    return min(results, key=lambda r: r["p90_ms"]), False
+
+
+def tune(slo_ms=AUTOTUNE_SLO_MS, threads=None, scales=INPUT_SCALES, batches=BATCH_SIZES,
+         rounds=ROUNDS, stand_in=False, save=True, path=AUTOTUNE_PATH):
+    import get_depth
+    if stand_in:
+        from benchmark import install_stand_in_models
+        install_stand_in_models()
+    else:
+        get_depth.get_depth_pipe()
+        get_depth.get_face_parsing()
+
+    before = get_depth.inference_settings()
+    frames = _frames(max(batches))
+    results = []
+    started = time.perf_counter()
+    try:
+        for n in threads or thread_counts():
+            for scale in scales:
+                for batch in sorted(batches):
+                    result = measure({"threads": n, "input_scale": scale, "segmentation_max_batch": batch}, frames, rounds)
+                    results.append(result)
+                    print(f"   threads={n} scale={scale} batch={batch}: p90 {result['p90_ms']} ms, "
+                          f"{result['frames_per_sec']} frames/s")
+                    if result["p90_ms"] > slo_ms:
+                        # Bigger batches only make the last frame wait longer
+                        break
+    finally:
+        get_depth.configure_inference(**before)
+
+    best, slo_met = choose(results, slo_ms)
+    config = {key: best[key] for key in ENV_OVERRIDES}
+    report = {
+        "fingerprint": fingerprint(stand_in),
+        "slo_ms": slo_ms,
+        "slo_met": slo_met,
+        "config": config,
+        "measured": best,
+        "results": results,
+        "frame_size": list(FRAME_SIZE),
+        "seconds": round(time.perf_counter() - started, 1),
+        "tuned_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    if save:
+        tmp = Path(path).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, path)
+    mark = "✅" if slo_met else "⚠️ SLO not met;"
+    print(f"{mark} Autotune picked {config} (p90 {best['p90_ms']} ms, {best['frames_per_sec']} frames/s)")
+    return report
+
+
+def load_saved(path=AUTOTUNE_PATH, stand_in=False):
+    """The saved config if it was tuned for this machine and these models, else None."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if report.get("fingerprint") != fingerprint(stand_in):
+        print(f"⚠️ {Path(path).name} was tuned for a different machine or model; ignoring it")
+        return None
+    return report
+
+
+def startup_config(mode=AUTOTUNE):
+    """Settings for warm_up() to apply: the saved (or, with AUTOTUNE=auto, freshly tuned) config minus env overrides."""
+    if mode == "off":
+        return {}
+    report = load_saved()
+    if report is None and mode == "auto":
+        print("🔧 No saved inference config for this machine; autotuning...")
+        report = tune()
+    if report is None:
+        return {}
+    config = {key: value for key, value in report["config"].items() if not os.environ.get(ENV_OVERRIDES[key])}
+    print(f"✓ Inference config from {AUTOTUNE_PATH.name}: {config}")
+    return config
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tune torch threads, input size and batch size for this machine")
+    parser.add_argument("--slo-ms", type=float, default=AUTOTUNE_SLO_MS, help="Per-frame latency target (p90)")
+    parser.add_argument("--threads", type=lambda s: [int(x) for x in s.split(",")], default=None,
+                        help=f"Thread counts to try (default {thread_counts()})")
+    parser.add_argument("--scales", type=lambda s: [float(x) for x in s.split(",")], default=list(INPUT_SCALES))
+    parser.add_argument("--batches", type=lambda s: [int(x) for x in s.split(",")], default=list(BATCH_SIZES))
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="Timed rounds per configuration")
+    parser.add_argument("--out", default=str(AUTOTUNE_PATH))
+    parser.add_argument("--stand-in", action="store_true", help="Use the offline stand-in models")
+    parser.add_argument("--dry-run", action="store_true", help="Measure and report without saving")
+    parser.add_argument("--show", action="store_true", help="Print the saved config and exit")
+    args = parser.parse_args()
+
+    if args.show:
+        with open(args.out, encoding="utf-8") as f:
+            print(json.dumps({k: v for k, v in json.load(f).items() if k != "results"}, indent=2))
+    else:
+        tune(args.slo_ms, args.threads, args.scales, args.batches, args.rounds, args.stand_in,
+             save=not args.dry_run, path=args.out)
@@ -0,0 +1,437 @@
+"""
+Reproducible offline benchmark for the posture pipeline.
+
+Suites:
+    metrics    - end-to-end frames/sec and per-stage latency of /api/get_metrics,
+                 using synthetic frames and small stand-in models (no downloads)
+    ingest     - POST throughput of /api/app.py
+    dashboard  - render cost of / as the posture log grows
+    memory     - peak RSS of segmentation post-processing (banded upsample vs.
+                 resizing the whole logits tensor), each run in a fresh process
+
+Usage:
+    python benchmark.py --out bench_results.json
+    python benchmark.py --suite metrics --frames 50 --real-models
+    python benchmark.py --compare bench_results.json
+
+Everything runs inside a temporary directory; api/logs and ../face are not touched.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+API_DIR = Path(__file__).resolve().parent
+SEED = 1234
+MEMORY_FRAME_SIZES = [(640, 360), (1280, 720), (1920, 1080)]
+
+# Face-parsing labels used by get_metrics -> synthetic colour for that region
+REGION_COLORS = {
+    0: (20, 20, 20),      # background
+    1: (230, 180, 150),   # face skin
+    2: (120, 200, 120),   # neck
+    18: (60, 90, 200),    # cloth / chest
+}
+NUM_LABELS = 19
+
+
+# ---------------------------------------------------------------------------
+# Synthetic frames and stand-in models
+# ---------------------------------------------------------------------------
+
+def synthetic_frame(rng, width=640, height=360):
+    """Webcam-like frame: background, a face ellipse, a neck and a chest block."""
+    yy, xx = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = REGION_COLORS[0]
+
+    cx = width / 2 + rng.uniform(-0.08, 0.08) * width
+    cy = height * 0.32 + rng.uniform(-0.05, 0.05) * height
+    rx, ry = width * 0.09, height * 0.2
+    chest = (yy > height * 0.68) & (np.abs(xx - cx) < width * 0.3)
+    neck = (yy > cy + ry * 0.8) & (yy <= height * 0.68) & (np.abs(xx - cx) < rx * 0.5)
+    face = ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1
+
+    frame[chest] = REGION_COLORS[18]
+    frame[neck] = REGION_COLORS[2]
+    frame[face] = REGION_COLORS[1]
+    noise = rng.integers(-6, 7, size=frame.shape)
+    return Image.fromarray(np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+class StandInDepthPipe:
+    """Callable with the same contract as the transformers depth pipeline."""
+
+    def __call__(self, image):
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+        h, w = gray.shape
+        # Tilted plane plus per-region offset so compute_rolls has something to fit
+        ramp = np.linspace(0, 40, h, dtype=np.float32)[:, None] + np.linspace(0, 20, w, dtype=np.float32)[None, :]
+        depth = np.clip(gray * 0.5 + ramp, 0, 255).astype(np.uint8)
+        return {"depth": Image.fromarray(depth, "L")}
+
+
+class _Inputs(dict):
+    def to(self, device):
+        return _Inputs({k: v.to(device) for k, v in self.items()})
+
+
+class StandInProcessor:
+    """Resizes to the Segformer input size and returns pixel_values."""
+
+    def __init__(self, size=512):
+        self.size = {"height": size, "width": size}
+
+    def __call__(self, images, return_tensors="pt", **kwargs):
+        import torch
+        if not isinstance(images, (list, tuple)):
+            images = [images]
+        size = (self.size["width"], self.size["height"])
+        arr = np.stack([np.asarray(im.convert("RGB").resize(size), dtype=np.float32) / 255.0
+                        for im in images])
+        return _Inputs(pixel_values=torch.from_numpy(arr).permute(0, 3, 1, 2).contiguous())
+
+
+def build_stand_in_model():
+    """Tiny torch module emitting (1, 19, H/4, W/4) logits like Segformer."""
+    import torch
+    from torch import nn
+
+    palette = torch.zeros(NUM_LABELS, 3)
+    palette[:] = 2.0  # unused labels never win
+    for label, color in REGION_COLORS.items():
+        palette[label] = torch.tensor(color, dtype=torch.float32) / 255.0
+
+    class _Output:
+        def __init__(self, logits):
+            self.logits = logits
+
+    class StandInSegmenter(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.register_buffer("palette", palette.view(1, NUM_LABELS, 3, 1, 1))
+            self.pool = nn.AvgPool2d(4)
+
+        def forward(self, pixel_values):
+            pooled = self.pool(pixel_values).unsqueeze(1)
+            return _Output(-((pooled - self.palette) ** 2).sum(dim=2))
+
+    return StandInSegmenter().eval()
+
+
+def install_stand_in_models():
+    import get_depth
+    get_depth.load_backend()
+    get_depth._depth_pipe = StandInDepthPipe()
+    get_depth._face_parsing_processor = StandInProcessor()
+    get_depth._face_parsing_model = build_stand_in_model()
+
+
+# ---------------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------------
+
+def _percentiles(samples):
+    arr = np.asarray(samples, dtype=np.float64) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+def bench_metrics(workdir, frames, warmup, real_models):
+    # get_depth/get_metrics/result_cache use ../storage and ../face relative to cwd
+    root = Path(workdir)
+    frames_dir = root / "storage" / "sessions" / "bench" / "frames"
+    frames_dir.mkdir(parents=True)
+    (root / "face").mkdir()
+    (root / "api").mkdir()
+    os.chdir(root / "api")
+
+    import get_metrics
+    import stage_timing
+
+    if real_models:
+        get_metrics.warm_up(background=False)
+    else:
+        install_stand_in_models()
+
+    client = get_metrics.app.test_client()
+    rng = np.random.default_rng(SEED)
+    latencies = []
+    for i in range(warmup + frames):
+        synthetic_frame(rng).save(frames_dir / f"frame_{i:06d}.jpg", "JPEG", quality=80)
+        if i == warmup:
+            stage_timing.reset()
+        start = time.perf_counter()
+        response = client.get(f"/api/get_metrics?id={i}")
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"get_metrics failed on frame {i}: {response.status_code}")
+        if i >= warmup:
+            latencies.append(elapsed)
+
+    return {
+        "frames": frames,
+        "real_models": real_models,
+        "frames_per_sec": round(len(latencies) / sum(latencies), 3),
+        "latency": _percentiles(latencies),
+        "stages": stage_timing.snapshot(),
+    }
+
+
+def _import_dashboard_app(log_dir):
+    """Import app.py with its logs redirected into `log_dir`."""
+    import storage_lifecycle
+
+    # Keep anything in app.py that touches storage off the real tree
+    storage_lifecycle.SESSIONS_DIR = Path(log_dir) / "sessions"
+    storage_lifecycle.FACE_DIR = Path(log_dir) / "face"
+    storage_lifecycle.LOG_DIR = Path(log_dir)
+
+    import app as dashboard_app
+
+    # Samples are written to and views read from app.LOG_DIR at call time
+    dashboard_app.LOG_DIR = Path(log_dir)
+    return dashboard_app
+
+
+def bench_ingest(workdir, requests_count):
+    dashboard_app = _import_dashboard_app(workdir)
+    client = dashboard_app.app.test_client()
+    rng = random.Random(SEED)
+    latencies = []
+    for _ in range(requests_count):
+        payload = {
+            "neck-strain": round(rng.uniform(0, 10), 2),
+            "eye-strain": round(rng.uniform(0, 5), 2),
+            "posture": rng.randint(0, 1),
+        }
+        start = time.perf_counter()
+        response = client.post("/api/app.py", json=payload)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"ingest failed: {response.status_code}")
+    return {
+        "requests": requests_count,
+        "requests_per_sec": round(len(latencies) / sum(latencies), 3),
+        "latency": _percentiles(latencies),
+    }
+
+
+def write_synthetic_log(path, lines, seed=SEED):
+    rng = random.Random(seed)
+    t = datetime(2025, 1, 1, 9, 0, 0)
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(lines):
+            t += timedelta(seconds=rng.randint(1, 10))
+            posture = rng.randint(0, 1)
+            status = "correct" if posture == 1 else "incorrect"
+            f.write(
+                f"{t:%Y-%m-%d %H:%M:%S},{rng.randint(0, 999):03d} - user=system posture_status={status} "
+                f"posture={posture} neck_strain={rng.uniform(0, 10):.2f} eye_strain={rng.uniform(0, 5):.2f}\n"
+            )
+
+
+def bench_dashboard(workdir, sizes, repeats):
+    dashboard_app = _import_dashboard_app(workdir)
+    client = dashboard_app.app.test_client()
+    results = []
+    for lines in sizes:
+        for old in Path(workdir).glob("posture_*.log"):
+            old.unlink()
+        log_path = Path(workdir) / "posture_9999-12-31_00-00-00.log"
+        write_synthetic_log(log_path, lines)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = client.get("/")
+            timings.append(time.perf_counter() - start)
+            if response.status_code not in (200, 304):
+                raise RuntimeError(f"dashboard failed: {response.status_code}")
+        # First hit parses and renders; later hits are served from the snapshot cache
+        results.append({"log_lines": lines, "bytes": log_path.stat().st_size,
+                        "cold_ms": round(timings[0] * 1000, 3), "render": _percentiles(timings)})
+    return results
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _postprocess_peak(mode, width, height, result):
+    """Runs in a fresh process: peak RSS growth of one segmentation post-processing call."""
+    sys.path.insert(0, str(API_DIR))
+    import get_depth
+    get_depth.load_backend()
+    torch, nn = get_depth.torch, get_depth.nn
+    # Segformer emits logits at 1/4 of its 512x512 input
+    logits = torch.randn(1, NUM_LABELS, 128, 128, generator=torch.Generator().manual_seed(SEED))
+
+    def run(size):
+        with torch.inference_mode():
+            if mode == "full":
+                upsampled = nn.functional.interpolate(logits, size=size, mode="bilinear", align_corners=False)
+                return upsampled.argmax(dim=1)[0].numpy().astype(np.uint8)
+            return get_depth.upsample_labels(logits, size)
+
+    run((96, 256))  # kernel and allocator warm-up outside the measurement
+    before = _peak_rss_mb()
+    labels = run((height, width))
+    result.put({"peak_mb": round(_peak_rss_mb() - before, 1), "labels": labels})
+
+
+def bench_memory(sizes):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for width, height in sizes:
+        runs = {}
+        for mode in ("full", "banded"):
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_postprocess_peak, args=(mode, width, height, queue))
+            proc.start()
+            runs[mode] = queue.get(timeout=300)
+            proc.join()
+        full, banded = runs["full"]["peak_mb"], runs["banded"]["peak_mb"]
+        results[f"{width}x{height}"] = {
+            "full_upsample_peak_mb": full,
+            "banded_peak_mb": banded,
+            "reduction": round(full / banded, 1) if banded else None,
+            # Can differ only where two classes tie to float rounding
+            "label_agreement": round(float(np.mean(runs["full"]["labels"] == runs["banded"]["labels"])), 6),
+        }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def _run_suite_in_subprocess(suite, args):
+    # Each suite gets a fresh interpreter: app.py monkey-patches with eventlet
+    # and the metrics suite changes the working directory.
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        out = tmp.name
+    cmd = [
+        sys.executable, str(Path(__file__).resolve()), "--suite", suite, "--out", out,
+        "--frames", str(args.frames), "--warmup", str(args.warmup),
+        "--requests", str(args.requests), "--repeats", str(args.repeats),
+        "--log-sizes", ",".join(str(s) for s in args.log_sizes),
+    ]
+    if args.real_models:
+        cmd.append("--real-models")
+    try:
+        subprocess.run(cmd, check=True, cwd=str(API_DIR))
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)[suite]
+    finally:
+        os.unlink(out)
+
+
+def run_suite(suite, args):
+    sys.path.insert(0, str(API_DIR))
+    with tempfile.TemporaryDirectory(prefix=f"posture_bench_{suite}_") as workdir:
+        cwd = os.getcwd()
+        try:
+            if suite == "metrics":
+                return bench_metrics(workdir, args.frames, args.warmup, args.real_models)
+            if suite == "ingest":
+                return bench_ingest(workdir, args.requests)
+            if suite == "dashboard":
+                return bench_dashboard(workdir, args.log_sizes, args.repeats)
+            if suite == "memory":
+                return bench_memory(MEMORY_FRAME_SIZES)
+        finally:
+            os.chdir(cwd)
+    raise ValueError(f"Unknown suite: {suite}")
+
+
+def environment_info():
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": SEED,
+    }
+
+
+def compare(current, baseline_path, tolerance=0.10):
+    """Print metrics that moved more than `tolerance` against a saved run."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def _flatten(obj, prefix=""):
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                yield from _flatten(v, f"{prefix}{k}.")
+        elif isinstance(obj, list):
+            for i, v in enumerate(obj):
+                yield from _flatten(v, f"{prefix}{i}.")
+        elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+            yield prefix[:-1], obj
+
+    old = dict(_flatten({k: v for k, v in baseline.items() if k != "environment"}))
+    regressions = 0
+    for key, value in _flatten({k: v for k, v in current.items() if k != "environment"}):
+        if key not in old or not old[key] or not (key.endswith("_ms") or key.endswith("_per_sec")):
+            continue
+        change = (value - old[key]) / old[key]
+        worse = change < -tolerance if key.endswith("_per_sec") else change > tolerance
+        if worse:
+            regressions += 1
+            print(f"⚠️ {key}: {old[key]} -> {value} ({change:+.0%})")
+    print("✓ No regressions" if regressions == 0 else f"❌ {regressions} regression(s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Posture pipeline benchmark")
+    parser.add_argument("--suite", choices=["all", "metrics", "ingest", "dashboard", "memory"], default="all")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE_JSON")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--log-sizes", type=lambda s: [int(x) for x in s.split(",")],
+                        default=[100, 1000, 10000, 50000])
+    parser.add_argument("--real-models", action="store_true",
+                        help="Use the real Hugging Face models instead of the offline stand-ins")
+    args = parser.parse_args()
+
+    if args.suite == "all":
+        results = {"environment": environment_info()}
+        for suite in ("metrics", "ingest", "dashboard", "memory"):
+            print(f"▶ Running {suite} benchmark...")
+            results[suite] = _run_suite_in_subprocess(suite, args)
+    else:
+        results = {"environment": environment_info(), args.suite: run_suite(args.suite, args)}
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✓ Results written to {args.out}")
+
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Per-user neutral baselines for eye and neck strain.
+
+`get_eye_strain` and `get_neck_strain` use fixed constants, so the same
+thresholds in `is_correct` mean different things for each camera and user.
+A Calibration collects face distance, face pitch and neck area from the first
+CALIBRATION_FRAMES usable frames: confident (get_metrics.observe_calibration
+applies the confidence gate) with finite values and a face in view. The
+posture verdict plays no part. It is computed with the very thresholds being
+calibrated, so a setup whose neutral pose trips them would never calibrate.
+The medians are then reduced to two numbers:
+
+    eye_scale    replaces the 40 in 40/(face_dist/5); the user's own baseline
+                 distance maps to NEUTRAL_EYE_STRAIN
+    neck_offset  is added inside max(0, ...); the baseline pitch/area maps to
+                 NEUTRAL_NECK_STRAIN
+
+Calibrated scoring therefore costs the same as the uncalibrated formulas.
+Baselines are stored as JSON under api/calibration/ and reloaded on restart.
+"""
+
+import json
+import math
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+CALIBRATION_DIR = Path(__file__).parent / "calibration"
+CALIBRATION_FRAMES = 10
+NEUTRAL_EYE_STRAIN = 2.0
+NEUTRAL_NECK_STRAIN = 1.0
+BASELINE_KEYS = ("face_dist", "face_pitch", "neck_area")
+
+# Defaults reproduce the original constants exactly
+DEFAULT_PARAMS = {"eye_scale": 40.0, "neck_offset": 0.0}
+
+
+def valid_baseline(baseline):
+    """Finite values and a positive face distance (eye_scale divides by nothing else)."""
+    if not baseline:
+        return False
+    try:
+        values = [float(baseline[key]) for key in BASELINE_KEYS]
+    except (KeyError, TypeError, ValueError):
+        return False
+    return all(math.isfinite(v) for v in values) and values[0] > 0
+
+
+class Calibration:
+    def __init__(self, key, frames=CALIBRATION_FRAMES):
+        self.key = key
+        self.frames = frames
+        self.samples = []
+        self.baseline = None
+        self.params = dict(DEFAULT_PARAMS)
+        self.lock = threading.Lock()
+
+    @property
+    def complete(self):
+        return self.baseline is not None
+
+    def observe(self, metric_dict):
+        """Feed one raw (uncalibrated) frame that passed the confidence gate; usable ones count toward the baseline."""
+        with self.lock:
+            if self.complete:
+                return False
+            sample = tuple(float(metric_dict[key]) for key in BASELINE_KEYS)
+            # No face (NaN or zero distance) says nothing about the user
+            if not all(math.isfinite(v) for v in sample) or sample[0] <= 0:
+                return False
+            self.samples.append(sample)
+            if len(self.samples) < self.frames:
+                return False
+            baseline = dict(zip(BASELINE_KEYS, (float(v) for v in np.median(np.asarray(self.samples), axis=0))))
+            self.samples = []
+            if not valid_baseline(baseline):
+                return False
+            self._set_baseline(baseline)
+        self.save()
+        print(f"✓ Calibrated {self.key}: {self.baseline}")
+        return True
+
+    def _set_baseline(self, baseline):
+        self.baseline = baseline
+        # eye: scale/(d/5) == NEUTRAL at d == face_dist
+        # neck: 2*p - a/2000 + offset == NEUTRAL at p == face_pitch, a == neck_area
+        self.params = {
+            "eye_scale": NEUTRAL_EYE_STRAIN * baseline["face_dist"] / 5,
+            "neck_offset": NEUTRAL_NECK_STRAIN - 2 * baseline["face_pitch"] + baseline["neck_area"] / 2000,
+        }
+
+    def status(self):
+        with self.lock:
+            return {
+                "calibrated": self.complete,
+                "progress": self.frames if self.complete else len(self.samples),
+                "frames_needed": self.frames,
+                "baseline": self.baseline,
+            }
+
+    def path(self):
+        return CALIBRATION_DIR / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', self.key)}.json"
+
+    def save(self):
+        CALIBRATION_DIR.mkdir(exist_ok=True)
+        with open(self.path(), "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "baseline": self.baseline}, f, indent=2)
+
+    def load(self):
+        try:
+            with open(self.path(), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if valid_baseline(data.get("baseline")):
+            self._set_baseline(data["baseline"])
+            return True
+        return False
+
+    def reset(self):
+        with self.lock:
+            self.samples = []
+            self.baseline = None
+            self.params = dict(DEFAULT_PARAMS)
+        try:
+            self.path().unlink()
+        except FileNotFoundError:
+            pass
+
+
+_lock = threading.Lock()
+_calibrations = {}
+
+
+def get_calibration(key):
+    with _lock:
+        calibration = _calibrations.get(key)
+        if calibration is None:
+            calibration = _calibrations[key] = Calibration(key)
+            calibration.load()
+        return calibration
@@ -0,0 +1,80 @@
+"""
+Server-recommended capture interval for the next frame.
+
+/api/analyze and /api/get_metrics answer with `next_capture_seconds`. The
+client waits that long (clamped to its own min/max) before its next capture
+instead of a fixed timer, so load adapts on two axes:
+
+    stability  every frame past STABLE_AFTER in which the smoothed and the
+               raw posture agree stretches the interval by STABLE_STEP, up
+               to MAX_STABILITY_FACTOR. A frame that disagrees with the
+               current posture drops it to MIN_CAPTURE_SECONDS, so the
+               hysteresis can confirm or reject the flip quickly.
+    load       the inference backlog (get_depth.inference_backlog(): frames
+               queued for a segmentation batch plus model calls blocked on an
+               inference slot), sampled as each analyze/get_metrics request
+               arrives and smoothed, scales the interval up by one base
+               interval per slot's worth of backlog. A busy server slows every
+               client down a little rather than queueing.
+
+Cheap-tier (cascade) frames keep the session's stability count.
+"""
+
+import os
+import threading
+
+from get_depth import INFERENCE_SLOTS, inference_backlog
+
+BASE_CAPTURE_SECONDS = float(os.environ.get("BASE_CAPTURE_SECONDS", "5"))
+MIN_CAPTURE_SECONDS = float(os.environ.get("MIN_CAPTURE_SECONDS", "2"))
+MAX_CAPTURE_SECONDS = float(os.environ.get("MAX_CAPTURE_SECONDS", "30"))
+STABLE_AFTER = 3             # agreeing frames before the interval starts to stretch
+STABLE_STEP = 0.25           # +25% of the base interval per further agreeing frame
+MAX_STABILITY_FACTOR = 4.0
+LOAD_EMA_ALPHA = 0.3
+
+
+class LoadGauge:
+    """Smoothed inference backlog, sampled as requests arrive."""
+
+    def __init__(self, alpha=LOAD_EMA_ALPHA, backlog=inference_backlog):
+        self.alpha = alpha
+        self.backlog = backlog
+        self.last = 0
+        self.smoothed = 0.0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        backlog = self.backlog()
+        with self._lock:
+            self.last = backlog
+            self.smoothed = self.alpha * backlog + (1 - self.alpha) * self.smoothed
+        return backlog
+
+    def factor(self, slots=INFERENCE_SLOTS):
+        # Nothing waiting: full speed. Each slot's worth of waiting calls adds a base interval
+        return 1.0 + self.smoothed / max(1, slots)
+
+
+load_gauge = LoadGauge()
+
+
+def stability_factor(tracker):
+    if tracker is None:
+        return 1.0
+    return min(MAX_STABILITY_FACTOR, 1.0 + STABLE_STEP * max(0, tracker.stable - STABLE_AFTER))
+
+
+def recommend(tracker, gauge=load_gauge):
+    """(seconds until the next capture, reason)."""
+    load = gauge.factor()
+    if tracker is not None and tracker.disagree > 0:
+        seconds, reason = MIN_CAPTURE_SECONDS * load, "confirming"
+    else:
+        stability = stability_factor(tracker)
+        seconds = BASE_CAPTURE_SECONDS * stability * load
+        reason = "stable" if stability > 1.0 else "default"
+    if load > 1.05:  # the EMA only decays toward 1 after a burst
+        reason = "load"
+    seconds = min(MAX_CAPTURE_SECONDS, max(MIN_CAPTURE_SECONDS, seconds))
+    return round(seconds, 2), reason
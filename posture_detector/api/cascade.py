@@ -0,0 +1,245 @@
+"""
+Two-tier inference: a cheap CPU check decides whether a frame needs the models.
+
+Most webcam frames look like the one before them. Tier 1 takes a few
+milliseconds:
+
+    - a 64x48 grayscale thumbnail compared with the session's reference frame
+      (the last frame that went through the models)
+    - OpenCV Haar face detection on a 160 px wide copy, when the OpenCV build
+      ships Haar cascades (4.x does, 5.x dropped them). The face has to be
+      found, or missed, as in the reference, and stay in roughly the same box.
+
+A frame that passes is "easy". It is answered from the reference frame's full
+result (tier "cheap"), which covers a person sitting still as well as an
+empty chair the models already confirmed. Anything else escalates to
+get_depth/get_feature (tier "full") and becomes the new reference. So does
+every CASCADE_MAX_REUSE-th easy frame, so slow drift can't go unnoticed.
+
+Off by default. Enable it with CASCADE=1 or ?cascade=1 on /api/get_metrics.
+
+    python cascade.py                  # synthetic frames, stand-in models
+    python cascade.py --frames DIR     # a session's frames
+reports the escalation rate and agreement with the full pipeline.
+"""
+
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+from stage_timing import span
+
+CASCADE_ENABLED = os.environ.get("CASCADE", "0") == "1"
+THUMB_SIZE = (64, 48)
+CHANGED_PIXEL_DELTA = 20        # grey levels for a thumbnail pixel to count as changed
+MAX_CHANGED_FRACTION = 0.01     # above this the scene changed
+MIN_FACE_IOU = 0.6
+DETECT_WIDTH = 160
+CASCADE_MAX_REUSE = int(os.environ.get("CASCADE_MAX_REUSE", "10"))
+
+# cv2 is only needed here, so it is imported on first use
+cv2 = None
+_detector = None
+_detector_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def get_face_detector():
+    """Haar frontal-face classifier, or False when this OpenCV build has none."""
+    global cv2, _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                try:
+                    import cv2 as _cv2
+                    cv2 = _cv2
+                    path = os.path.join(_cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+                    detector = _cv2.CascadeClassifier(path)
+                    _detector = False if detector.empty() else detector
+                except (ImportError, AttributeError):
+                    _detector = False
+                if not _detector:
+                    print("⚠️ No Haar face detector in this OpenCV build - cascade uses the thumbnail check only")
+    return _detector
+
+
+class CheapView:
+    def __init__(self, thumb, face, detector):
+        self.thumb = thumb
+        self.face = face
+        self.detector = detector
+
+
+def cheap_view(frame):
+    with span("cascade_check"):
+        gray = frame.image.convert("L")
+        thumb = np.asarray(gray.resize(THUMB_SIZE, Image.BILINEAR), dtype=np.int16)
+        detector = get_face_detector()
+        face = None
+        if detector:
+            w, h = gray.size
+            small = np.asarray(gray.resize((DETECT_WIDTH, max(1, round(h * DETECT_WIDTH / w))), Image.BILINEAR))
+            faces = detector.detectMultiScale(small, scaleFactor=1.1, minNeighbors=4, minSize=(16, 16))
+            if len(faces):
+                x, y, fw, fh = max(faces, key=lambda f: f[2] * f[3])
+                sh, sw = small.shape
+                face = (x / sw, y / sh, fw / sw, fh / sh)
+    return CheapView(thumb, face, bool(detector))
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class CascadeState:
+    """Per-session reference frame and the full result computed for it."""
+
+    def __init__(self):
+        self.view = None
+        self.result = None
+        self.reuses = 0
+
+    def decide(self, view):
+        """(easy, reason) for `view` against the reference frame."""
+        if self.result is None:
+            return False, "no_reference"
+        if self.reuses >= CASCADE_MAX_REUSE:
+            return False, "refresh"
+        changed = np.count_nonzero(np.abs(view.thumb - self.view.thumb) > CHANGED_PIXEL_DELTA)
+        if changed > MAX_CHANGED_FRACTION * view.thumb.size:
+            return False, "scene_changed"
+        if view.detector:
+            if (view.face is None) != (self.view.face is None):
+                return False, "face_changed"
+            if view.face is not None and iou(view.face, self.view.face) < MIN_FACE_IOU:
+                return False, "face_moved"
+        return True, "unchanged"
+
+    def reuse(self):
+        self.reuses += 1
+        metric_dict = dict(self.result)
+        metric_dict["tier"] = "cheap"
+        metric_dict["posture_changed"] = False
+        return metric_dict
+
+    def remember(self, view, metric_dict):
+        self.view = view
+        self.result = dict(metric_dict)
+        self.reuses = 0
+
+
+def session_state(tracker):
+    if tracker.cascade is None:
+        tracker.cascade = CascadeState()
+    return tracker.cascade
+
+
+def record(reason):
+    with _stats_lock:
+        _stats["frames"] += 1
+        _stats["escalated" if reason != "unchanged" else "answered_cheap"] += 1
+        _stats[f"reason:{reason}"] += 1
+
+
+def cascade_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    frames = stats.get("frames", 0)
+    stats["escalation_rate"] = round(stats.get("escalated", 0) / frames, 4) if frames else None
+    stats["enabled_by_default"] = CASCADE_ENABLED
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Offline evaluation against the full pipeline
+# ---------------------------------------------------------------------------
+
+COMPARED_METRICS = ("eye_strain", "neck_strain", "face_pitch", "chest_pitch", "depth_diff")
+
+
+def synthetic_sequence(count, hold=8, seed=0):
+    """Webcam-like sequence: a new pose every `hold` frames, sensor noise in between."""
+    from benchmark import synthetic_frame
+    rng = np.random.default_rng(seed)
+    base = None
+    for i in range(count):
+        if i % hold == 0:
+            base = np.asarray(synthetic_frame(rng), dtype=np.int16)
+        noise = rng.integers(-3, 4, size=base.shape)
+        yield Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def evaluate(images):
+    """Run every frame through the full pipeline and through the cascade; compare."""
+    import time
+    from frame_cache import DecodedFrame
+    from get_metrics import compute_metrics
+    from posture_tracker import PostureTracker
+
+    full_tracker, cascade_tracker = PostureTracker(), PostureTracker()
+    agree = 0
+    errors = {name: [] for name in COMPARED_METRICS}
+    tiers = Counter()
+    cheap_seconds = []
+    n = 0
+    for n, image in enumerate(images, start=1):
+        frame = DecodedFrame(f"eval/{n}", image)
+        full = compute_metrics(n, frame, save_artifacts=False, tracker=full_tracker)
+        start = time.perf_counter()
+        tiered = compute_metrics(n, frame, save_artifacts=False, tracker=cascade_tracker, cascade=True)
+        if tiered["tier"] == "cheap":
+            cheap_seconds.append(time.perf_counter() - start)
+        tiers[tiered["tier"]] += 1
+        agree += int(full["posture"] == tiered["posture"])
+        for name in COMPARED_METRICS:
+            errors[name].append(abs(float(full[name]) - float(tiered[name])))
+    return {
+        "frames": n,
+        "escalated": tiers["full"],
+        "escalation_rate": round(tiers["full"] / n, 4) if n else None,
+        "posture_agreement": round(agree / n, 4) if n else None,
+        "mean_abs_error": {k: round(float(np.mean(v)), 4) for k, v in errors.items() if v},
+        "cheap_path_ms": round(float(np.mean(cheap_seconds)) * 1000, 3) if cheap_seconds else None,
+        "face_detector": bool(get_face_detector()),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import tempfile
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Escalation rate and accuracy of the cascade vs. the full pipeline")
+    parser.add_argument("--frames", help="Directory of frames (e.g. storage/sessions/<id>/frames); default: synthetic")
+    parser.add_argument("--count", type=int, default=64, help="Synthetic frames to generate")
+    parser.add_argument("--hold", type=int, default=8, help="Synthetic frames per pose")
+    parser.add_argument("--real-models", action="store_true", help="Use the real models instead of the offline stand-ins")
+    args = parser.parse_args()
+
+    # get_metrics imports this module as `cascade`; use that copy so detector and stats are shared
+    from cascade import evaluate, synthetic_sequence
+
+    if args.frames:
+        paths = sorted(p for p in Path(args.frames).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        images = (Image.open(p).convert("RGB") for p in paths)
+    else:
+        images = synthetic_sequence(args.count, args.hold)
+
+    if not args.real_models:
+        from benchmark import install_stand_in_models
+        install_stand_in_models()
+    # compute_metrics writes nothing with save_artifacts=False, but stay out of the tree anyway
+    os.chdir(tempfile.mkdtemp())
+    print(json.dumps(evaluate(images), indent=2))
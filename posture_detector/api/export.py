@@ -0,0 +1,328 @@
+"""
+Bulk export of posture history as Arrow record batches or Parquet files.
+
+Two datasets:
+    samples  - every line of api/logs/posture_*.log (what the dashboard plots)
+    metrics  - full metric dicts from the MetricsStore (storage/metrics, see replay.py)
+
+Rows are streamed from disk and written EXPORT_BATCH_ROWS at a time. At most
+MAX_OPEN_PARTITIONS files are open at once, so memory stays flat however
+much history there is.
+
+    python export.py --out ../storage/export                 # both datasets as Parquet
+    python export.py --dataset metrics --format arrow --since 2025-10-01 --user alice
+
+writes Hive-style partitions: {out}/{dataset}/user={user}/day={YYYY-MM-DD}/part-00000.parquet
+
+The metrics service serves the same rows as an Arrow IPC stream to holders
+of the ADMIN_TOKEN (see profiling.py), since it covers every user:
+
+    curl -H "Authorization: Bearer $ADMIN_TOKEN" \
+        "localhost:5500/api/export?dataset=samples&user=alice&since=2025-10-01&until=2025-10-31"
+
+pyarrow is only needed here, so it is imported on first use.
+"""
+
+import json
+import os
+import re
+import shutil
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from fanout import DEFAULT_USER
+from metrics_store import MetricsStore
+from storage_lifecycle import LOG_DIR
+
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "8192"))
+MAX_OPEN_PARTITIONS = 32
+DATASETS = ("samples", "metrics")
+FORMATS = ("parquet", "arrow")
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+LOG_PATTERN = re.compile(
+    r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ - user=(\w+) posture_status=(\w+) posture=(\d+) neck_strain=([\d.]+) eye_strain=([\d.]+)"
+)
+
+# Scalar metrics that get their own float64 column; the full dict is kept as JSON too
+METRIC_COLUMNS = (
+    "chest_roll", "chest_pitch", "neck_roll", "neck_pitch", "face_roll", "face_pitch",
+    "face_dist", "chest_dist", "depth_diff", "neck_area", "eye_strain", "neck_strain", "confidence",
+)
+
+pa = None
+_schemas = {}
+
+
+def load_arrow():
+    global pa
+    if pa is None:
+        try:
+            import pyarrow as _pa
+            import pyarrow.ipc  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("Export needs pyarrow: pip install pyarrow") from e
+        pa = _pa
+    return pa
+
+
+def schema(dataset):
+    load_arrow()
+    if dataset not in _schemas:
+        common = [pa.field("user", pa.string()), pa.field("day", pa.string())]
+        if dataset == "samples":
+            fields = common + [
+                pa.field("timestamp", pa.timestamp("ms")),
+                pa.field("status", pa.string()),
+                pa.field("posture", pa.int8()),
+                pa.field("neck_strain", pa.float64()),
+                pa.field("eye_strain", pa.float64()),
+                pa.field("log", pa.string()),
+            ]
+        else:
+            fields = common + [
+                pa.field("session", pa.string()),
+                pa.field("index", pa.int64()),
+                pa.field("frame", pa.string()),
+                pa.field("captured_at", pa.timestamp("s")),
+                pa.field("posture", pa.int8()),
+                pa.field("raw_posture", pa.int8()),
+                pa.field("tier", pa.string()),
+                pa.field("error", pa.string()),
+            ] + [pa.field(name, pa.float64()) for name in METRIC_COLUMNS] + [
+                pa.field("metrics_json", pa.string()),
+            ]
+        _schemas[dataset] = pa.schema(fields)
+    return _schemas[dataset]
+
+
+# ---------------------------------------------------------------------------
+# Row sources (generators; nothing is read ahead)
+# ---------------------------------------------------------------------------
+
+def parse_day(value):
+    """'YYYY-MM-DD' (normalised) for `since`/`until`; ValueError for anything else."""
+    return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+
+
+def _keep(user, day, users, since, until):
+    return (not users or user in users) and (not since or day >= since) and (not until or day <= until)
+
+
+def iter_samples(users=None, since=None, until=None, log_dir=None):
+    # One file per day/user/node (or per run, for older logs); rows keep file order
+    for path in sorted(Path(log_dir or LOG_DIR).glob("posture_*.log")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                m = LOG_PATTERN.search(line)
+                if not m:
+                    continue
+                t, u, s, p, n, e = m.groups()
+                day = t[:10]
+                if not _keep(u, day, users, since, until):
+                    continue
+                yield {
+                    "user": u,
+                    "day": day,
+                    "timestamp": datetime.strptime(t, "%Y-%m-%d %H:%M:%S"),
+                    "status": s,
+                    "posture": int(p),
+                    "neck_strain": float(n),
+                    "eye_strain": float(e),
+                    "log": path.name,
+                }
+
+
+def iter_metrics(users=None, since=None, until=None, store=None):
+    for row in (store or MetricsStore()).iter_rows():
+        captured_at = datetime.fromisoformat(row["captured_at"]) if row.get("captured_at") else None
+        day = captured_at.date().isoformat() if captured_at else "unknown"
+        user = row.get("user") or DEFAULT_USER
+        if not _keep(user, day, users, since, until):
+            continue
+        metrics = row.get("metrics") or {}
+        out = {
+            "user": user,
+            "day": day,
+            "session": row["session"],
+            "index": row["index"],
+            "frame": row.get("frame"),
+            "captured_at": captured_at,
+            "posture": metrics.get("posture"),
+            "raw_posture": metrics.get("raw_posture"),
+            "tier": metrics.get("tier"),
+            "error": row.get("error"),
+            "metrics_json": json.dumps(metrics, separators=(",", ":")) if metrics else None,
+        }
+        for name in METRIC_COLUMNS:
+            value = metrics.get(name)
+            out[name] = float(value) if value is not None else None
+        yield out
+
+
+def iter_rows(dataset, users=None, since=None, until=None):
+    if dataset == "samples":
+        return iter_samples(users, since, until)
+    if dataset == "metrics":
+        return iter_metrics(users, since, until)
+    raise ValueError(f"Unknown dataset: {dataset}")
+
+
+def iter_batches(rows, dataset, batch_rows=None):
+    """Group rows into RecordBatches of at most `batch_rows`."""
+    sch = schema(dataset)
+    batch_rows = batch_rows or EXPORT_BATCH_ROWS
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= batch_rows:
+            yield pa.RecordBatch.from_pylist(buffer, schema=sch)
+            buffer = []
+    if buffer:
+        yield pa.RecordBatch.from_pylist(buffer, schema=sch)
+
+
+# ---------------------------------------------------------------------------
+# Sinks
+# ---------------------------------------------------------------------------
+
+class _Chunks:
+    """File-like sink that hands back whatever pyarrow wrote since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def stream_ipc(dataset, users=None, since=None, until=None, batch_rows=None):
+    """Yield an Arrow IPC stream in chunks, one record batch at a time."""
+    sch = schema(dataset)
+    sink = _Chunks()
+    writer = pa.ipc.new_stream(sink, sch)
+    for batch in iter_batches(iter_rows(dataset, users, since, until), dataset, batch_rows):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+class PartitionedWriter:
+    """Writes rows into {root}/user=../day=../part-NNNNN files, flushing per partition."""
+
+    def __init__(self, root, dataset, fmt="parquet", batch_rows=None):
+        self.root = Path(root)
+        self.schema = schema(dataset)
+        self.fmt = fmt
+        self.batch_rows = batch_rows or EXPORT_BATCH_ROWS
+        self.buffers = {}
+        self.writers = OrderedDict()     # (user, day) -> open writer, least recently used first
+        self.parts = {}
+        self.buffered = 0
+        self.rows = 0
+        self.files = 0
+
+    def add(self, row):
+        key = (row["user"], row["day"])
+        buffer = self.buffers.setdefault(key, [])
+        buffer.append(row)
+        self.rows += 1
+        self.buffered += 1
+        if len(buffer) >= self.batch_rows:
+            self._flush(key)
+        elif self.buffered >= self.batch_rows * MAX_OPEN_PARTITIONS:
+            # Many small partitions interleaved: write them out rather than grow
+            for other in list(self.buffers):
+                self._flush(other)
+
+    def _open(self, key):
+        writer = self.writers.get(key)
+        if writer is not None:
+            self.writers.move_to_end(key)
+            return writer
+        if len(self.writers) >= MAX_OPEN_PARTITIONS:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        user, day = key
+        directory = self.root / f"user={user}" / f"day={day}"
+        directory.mkdir(parents=True, exist_ok=True)
+        part = self.parts.get(key, 0)
+        self.parts[key] = part + 1
+        self.files += 1
+        path = directory / f"part-{part:05d}.{'parquet' if self.fmt == 'parquet' else 'arrow'}"
+        if self.fmt == "parquet":
+            writer = pa.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(str(path), self.schema)
+        self.writers[key] = writer
+        return writer
+
+    def _flush(self, key):
+        buffer = self.buffers.pop(key, None)
+        if buffer:
+            self.buffered -= len(buffer)
+            self._open(key).write_batch(pa.RecordBatch.from_pylist(buffer, schema=self.schema))
+
+    def close(self):
+        for key in list(self.buffers):
+            self._flush(key)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+def export(out_dir, datasets=DATASETS, fmt="parquet", users=None, since=None, until=None,
+           batch_rows=None, overwrite=False):
+    load_arrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    summary = {}
+    for dataset in datasets:
+        root = Path(out_dir) / dataset
+        if root.exists() and any(root.iterdir()):
+            if not overwrite:
+                raise FileExistsError(f"{root} is not empty (use --overwrite)")
+            shutil.rmtree(root)
+        writer = PartitionedWriter(root, dataset, fmt, batch_rows)
+        try:
+            for row in iter_rows(dataset, users, since, until):
+                writer.add(row)
+        finally:
+            writer.close()
+        summary[dataset] = {"rows": writer.rows, "files": writer.files, "path": str(root)}
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export posture history as Parquet/Arrow, partitioned by user and day")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--dataset", choices=DATASETS + ("all",), default="all")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--user", action="append", help="Only these users (repeatable)")
+    parser.add_argument("--since", type=parse_day, help="First day to include (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_day, help="Last day to include (YYYY-MM-DD)")
+    parser.add_argument("--batch-rows", type=int, default=None, help=f"Rows per record batch (default {EXPORT_BATCH_ROWS})")
+    parser.add_argument("--overwrite", action="store_true", help="Replace an existing export in --out")
+    args = parser.parse_args()
+
+    datasets = DATASETS if args.dataset == "all" else (args.dataset,)
+    result = export(args.out, datasets, args.format, args.user, args.since, args.until, args.batch_rows, args.overwrite)
+    print(f"✅ Export finished: {json.dumps(result)}")
@@ -0,0 +1,104 @@
+"""
+Socket.IO fan-out across processes and nodes.
+
+Without a message queue an emit only reaches clients connected to the process
+that made it, so app.py can't run as more than one instance. The backend is
+picked by SOCKETIO_MESSAGE_QUEUE:
+
+    (unset)                 single process, emits stay local (default)
+    memory://               in-process LocalBroker; lets several servers in one
+                            process share emits (tests, benchmarks)
+    redis://, amqp://, ...  handed to Flask-SocketIO as message_queue (needs
+                            the matching client library: redis, kombu, ...)
+
+Dashboard state is partitioned by user. Each client joins user_room(user), or
+user_room(ALL_USERS) for the combined view, and every sample is emitted only
+to its user's room and the combined room. Any node can then take any
+dashboard connection. Each node writes its own per-day, per-user log, and views
+are built from every log in the logs directory, so nodes sharing that
+directory all serve complete views.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+from collections import defaultdict
+
+import socketio
+
+MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None
+CHANNEL = "flask-socketio"
+ALL_USERS = "*"
+DEFAULT_USER = "system"
+
+
+def normalize_user(user):
+    """User ids end up in log lines parsed with \\w+, so keep them to that alphabet."""
+    if user is None:
+        return None
+    user = re.sub(r"\W", "_", str(user).strip())[:64]
+    return user or None
+
+
+def user_room(user):
+    return f"user:{user}"
+
+
+class LocalBroker:
+    """Minimal pub/sub: every subscriber of a channel gets every message."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(list)
+
+    def subscribe(self, channel):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers[channel].append(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            if q in self._subscribers[channel]:
+                self._subscribers[channel].remove(q)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers[channel])
+        for q in subscribers:
+            q.put(message)
+        return len(subscribers)
+
+
+local_broker = LocalBroker()
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """Client manager that fans out through a LocalBroker instead of Redis/AMQP."""
+
+    name = "local"
+
+    def __init__(self, broker=None, channel=CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker or local_broker
+        # Subscribe now so nothing published before the listener starts is lost
+        self._queue = None if write_only else self.broker.subscribe(channel)
+
+    def _publish(self, data):
+        # Serialize like the network backends do, so nothing shares mutable state
+        return self.broker.publish(self.channel, json.dumps(data))
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+
+def socketio_options(url=MESSAGE_QUEUE, broker=None):
+    """Extra SocketIO(...) keyword arguments for the configured fan-out backend."""
+    if not url:
+        return {}
+    if url.startswith("memory://"):
+        return {"client_manager": LocalBrokerManager(broker)}
+    return {"message_queue": url, "channel": CHANNEL}
@@ -0,0 +1,154 @@
+"""
+Declarative posture rules evaluated with NumPy.
+
+The same thresholds used by `ai_feedback.generate_fallback_feedback` and
+`get_metrics.is_correct`, expressed as tables so historical sessions can be
+scored thousands of samples at a time. test_feedback_rules.py checks them
+against the scalar versions.
+"""
+
+import numpy as np
+
+# Feedback tips, in the order they are reported. Within a group only the first
+# matching rule fires (same as the if/elif chains in generate_fallback_feedback).
+FEEDBACK_RULES = [
+    {"group": "torsion", "metric": "torsion_angle", "op": "gt", "threshold": 25, "severity": "critical",
+     "message": "🔴 Critical: Your body is twisted {value:.0f}°. Rotate your torso to face your screen directly."},
+    {"group": "torsion", "metric": "torsion_angle", "op": "gt", "threshold": 15, "severity": "warning",
+     "message": "⚠️ Your torso is rotated {value:.0f}°. Straighten up to reduce strain."},
+    {"group": "depth_diff", "metric": "depth_diff", "op": "gt", "threshold": 0.18, "severity": "critical",
+     "message": "🔴 You're leaning far forward. Pull your head back and sit upright."},
+    {"group": "depth_diff", "metric": "depth_diff", "op": "gt", "threshold": 0.12, "severity": "warning",
+     "message": "⚠️ Your head is leaning forward. Align your head with your spine."},
+    {"group": "face_angle", "metric": "face_angle", "op": "abs_gt", "threshold": 15, "severity": "warning",
+     "message": "Your head is tilted {abs_value:.0f}° to the {direction}. Level your head."},
+    {"group": "face_yaw", "metric": "face_yaw_angle", "op": "abs_gt", "threshold": 25, "severity": "warning",
+     "message": "You're looking sideways. Turn to face your screen directly."},
+]
+
+# Any matching rule marks the sample as incorrect posture (get_metrics.is_correct).
+POSTURE_RULES = [
+    {"metric": "eye_strain", "op": "gt", "threshold": 5, "severity": "critical",
+     "message": "Eye strain is too high."},
+    {"metric": "neck_strain", "op": "gt", "threshold": 5, "severity": "critical",
+     "message": "Neck strain is too high."},
+    {"metric": "chest_roll", "op": "gt", "threshold": 10, "severity": "warning",
+     "message": "Chest is rolled to one side."},
+    {"metric": "chest_pitch", "op": "gt", "threshold": 10, "severity": "warning",
+     "message": "Chest is pitched forward or back."},
+]
+
+GOOD_POSTURE_MESSAGE = "✓ Great posture! Keep it up. Remember to take breaks every 30 minutes."
+MAX_TIPS = 2
+
+FEEDBACK_GROUPS = list(dict.fromkeys(rule["group"] for rule in FEEDBACK_RULES))
+
+OPS = {
+    "gt": lambda values, threshold: values > threshold,
+    "abs_gt": lambda values, threshold: np.abs(values) > threshold,
+}
+
+
+def to_columns(records, metrics):
+    """Turn a list of metric dicts into float64 columns (missing keys become 0)."""
+    return {
+        name: np.fromiter((r.get(name, 0) for r in records), dtype=np.float64, count=len(records))
+        for name in metrics
+    }
+
+
+def _column(columns, name, size):
+    if name not in columns:
+        return np.zeros(size, dtype=np.float64)
+    return np.asarray(columns[name], dtype=np.float64)
+
+
+def _batch_size(columns):
+    sizes = {np.shape(col)[0] for col in columns.values()}
+    if len(sizes) > 1:
+        raise ValueError(f"Metric columns have different lengths: {sorted(sizes)}")
+    return sizes.pop() if sizes else 0
+
+
+def rule_mask(rule, columns, size=None):
+    """Boolean array of samples where `rule` fires."""
+    if size is None:
+        size = _batch_size(columns)
+    return OPS[rule["op"]](_column(columns, rule["metric"], size), rule["threshold"])
+
+
+def evaluate_posture(columns):
+    """
+    Vectorized `is_correct`.
+
+    Returns:
+        (correct, failed) where `correct` is a bool array of shape (N,) and
+        `failed` is a bool array of shape (len(POSTURE_RULES), N).
+    """
+    size = _batch_size(columns)
+    failed = np.zeros((len(POSTURE_RULES), size), dtype=bool)
+    for i, rule in enumerate(POSTURE_RULES):
+        failed[i] = rule_mask(rule, columns, size)
+    return ~failed.any(axis=0), failed
+
+
+def evaluate_feedback(columns):
+    """
+    Vectorized rule matching for `generate_fallback_feedback`.
+
+    Returns:
+        int16 array of shape (len(FEEDBACK_GROUPS), N) holding the index into
+        FEEDBACK_RULES that fired for each group, or -1 when none did.
+    """
+    size = _batch_size(columns)
+    fired = np.full((len(FEEDBACK_GROUPS), size), -1, dtype=np.int16)
+    # Walk rules backwards so the first rule of each group wins, like elif.
+    for idx in range(len(FEEDBACK_RULES) - 1, -1, -1):
+        rule = FEEDBACK_RULES[idx]
+        row = fired[FEEDBACK_GROUPS.index(rule["group"])]
+        row[rule_mask(rule, columns, size)] = idx
+    return fired
+
+
+def severity_counts(fired):
+    """Count fired feedback rules per severity across the whole batch."""
+    counts = {}
+    hits = np.bincount(fired[fired >= 0].astype(np.int64), minlength=len(FEEDBACK_RULES))
+    for rule, n in zip(FEEDBACK_RULES, hits):
+        counts[rule["severity"]] = counts.get(rule["severity"], 0) + int(n)
+    return counts
+
+
+def format_tip(rule, value):
+    return rule["message"].format(
+        value=value,
+        abs_value=abs(value),
+        direction="left" if value < 0 else "right",
+    )
+
+
+def render_feedback(fired, columns, limit=MAX_TIPS):
+    """Build the feedback string for every sample from `evaluate_feedback` output."""
+    size = fired.shape[1]
+    values = {rule["metric"]: _column(columns, rule["metric"], size) for rule in FEEDBACK_RULES}
+    messages = []
+    for j in range(size):
+        tips = []
+        for idx in fired[:, j]:
+            if idx < 0:
+                continue
+            rule = FEEDBACK_RULES[idx]
+            tips.append(format_tip(rule, float(values[rule["metric"]][j])))
+            if len(tips) == limit:
+                break
+        messages.append(" ".join(tips) if tips else GOOD_POSTURE_MESSAGE)
+    return messages
+
+
+def score_records(records):
+    """Score a list of metric dicts: posture flag and feedback text per sample."""
+    metrics = {rule["metric"] for rule in FEEDBACK_RULES + POSTURE_RULES}
+    columns = to_columns(records, metrics)
+    correct, _ = evaluate_posture(columns)
+    feedback = render_feedback(evaluate_feedback(columns), columns)
+    return [{"posture": int(ok), "feedback": text} for ok, text in zip(correct, feedback)]
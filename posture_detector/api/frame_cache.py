@@ -0,0 +1,95 @@
+"""
+Decode-once frame handles shared by every pipeline stage.
+
+`get_frame(path)` returns a DecodedFrame whose PIL image is decoded exactly
+once. A small LRU keyed by (path, mtime, size) keeps recent frames around so
+retries and batch reprocessing skip the JPEG decode entirely.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from stage_timing import span
+
+FRAME_CACHE_SIZE = int(os.environ.get("FRAME_CACHE_SIZE", "8"))
+
+
+class DecodedFrame:
+    """A decoded frame; `image` is the PIL image handed to the models and the cascade."""
+
+    def __init__(self, path, image, digest=None):
+        self.path = path
+        self.image = image
+        # sha256 of the encoded bytes; content address for result_cache
+        self.digest = digest
+        self.size = image.size  # (W, H), same as PIL
+
+
+def decode_frame(path, name=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    return decode_frame_bytes(data, name or path)
+
+
+def decode_frame_bytes(data, name="stream"):
+    """Decode an in-memory JPEG/PNG (e.g. from a stream) without touching disk."""
+    with span("image_decode"):
+        digest = hashlib.sha256(data).hexdigest()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    return DecodedFrame(name, image, digest)
+
+
+def frame_from_raw(data, width, height, name="stream"):
+    """Wrap raw packed RGB bytes as a frame; no decode step at all."""
+    with span("image_decode"):
+        digest = hashlib.sha256(data).hexdigest()
+        image = Image.frombytes("RGB", (width, height), data)
+    return DecodedFrame(name, image, digest)
+
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def get_frame(path):
+    """Cached DecodedFrame for `path`; re-decodes if the file changed on disk."""
+    key = _key(path)
+    with _lock:
+        frame = _cache.get(key)
+        if frame is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return frame
+        _stats["misses"] += 1
+
+    frame = decode_frame(path)
+    with _lock:
+        _cache[key] = frame
+        _cache.move_to_end(key)
+        while len(_cache) > FRAME_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return frame
+
+
+def cache_info():
+    with _lock:
+        return {"size": len(_cache), "capacity": FRAME_CACHE_SIZE, **_stats}
+
+
+def clear():
+    with _lock:
+        _cache.clear()
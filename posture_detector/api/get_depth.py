@@ -1,115 +1,383 @@
 import os
 import sys
+import threading
+import time
+from contextlib import contextmanager
 
 # Set environment variables BEFORE any imports
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
 os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
 
-# Import torch FIRST before transformers
-import torch
-from torch import nn
 import numpy as np
 from PIL import Image
 
-# CRITICAL FIX for PyTorch 2.9.0+: Patch torch.load BEFORE importing transformers
-# This prevents the "Cannot copy out of meta tensor" error
-_original_torch_load = torch.load
+from frame_cache import get_frame
+from micro_batch import MicroBatcher, Slots
+from stage_timing import span
 
-def _patched_torch_load(*args, **kwargs):
-    # Force weights_only=False to prevent meta tensor issues
-    if 'weights_only' not in kwargs:
-        kwargs['weights_only'] = False
-    return _original_torch_load(*args, **kwargs)
+# torch and transformers are heavy, so they are imported on first use (or by
+# warm_up() in a background thread) instead of at module import time.
+torch = None
+nn = None
+pipeline = None
+SegformerImageProcessor = None
+SegformerForSemanticSegmentation = None
 
-torch.load = _patched_torch_load
+DEPTH_MODEL_ID = "depth-anything/Depth-Anything-V2-Metric-Indoor-Base-hf"
+FACE_PARSING_MODEL_ID = "jonathandinu/face-parsing"
 
-print("✓ PyTorch patches applied")
-print(f"✓ PyTorch version: {torch.__version__}")
-
-# NOW import transformers AFTER all patches are applied
-from transformers import pipeline, SegformerImageProcessor, SegformerForSemanticSegmentation
-
-print(torch.__version__)
-print(torch.backends.mps.is_available())
-print(torch.backends.mps.is_built())
+# Concurrent forward passes allowed across request threads (env override);
+# on CPU more than one mostly splits the same cores between requests.
+INFERENCE_SLOTS = int(os.environ.get("INFERENCE_SLOTS", "1"))
+# A segmentation request that finds every inference slot busy keeps collecting
+# frames until one frees, up to SEGMENTATION_MAX_BATCH frames or this long
+# (0 disables), so requests queued behind a forward pass share the next one.
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "250"))
+SEGMENTATION_MAX_BATCH = int(os.environ.get("SEGMENTATION_MAX_BATCH", "4"))
+# Segmentation logits are resized to frame size this many rows at a time;
+# the whole 19-class float32 tensor at 1280x720 would be ~70 MB.
+UPSAMPLE_BAND_ROWS = 32
+# Model input side as a fraction of each model's native size (518 depth,
+# 512 face parsing). Below 1.0 trades mask/depth detail for speed; autotune.py
+# picks it per machine.
+INPUT_SCALE = float(os.environ.get("INPUT_SCALE", "1.0"))
+DEPTH_INPUT_SIZE = 518
+SEGMENTATION_INPUT_SIZE = 512
 
 # Global model cache to prevent reloading and meta tensor issues
+_depth_pipe = None
 _face_parsing_model = None
 _face_parsing_processor = None
 
-def get_depth(id):
+_backend_lock = threading.Lock()
+_models_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_ready = threading.Event()
+_inference_slots = Slots(INFERENCE_SLOTS)
+_warmup_thread = None
+_warmup_error = None
+
+# Startup phase name -> seconds
+STARTUP_TIMINGS = {}
+
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = round(time.perf_counter() - start, 3)
+
+
+def load_backend():
+    global torch, nn, pipeline, SegformerImageProcessor, SegformerForSemanticSegmentation
+    if torch is not None:
+        return
+    with _backend_lock:
+        if torch is not None:
+            return
+
+        # Import torch FIRST before transformers
+        with timed_phase("import_torch"):
+            import torch as _torch
+            from torch import nn as _nn
+
+        # CRITICAL FIX for PyTorch 2.9.0+: Patch torch.load BEFORE importing transformers
+        # This prevents the "Cannot copy out of meta tensor" error
+        _original_torch_load = _torch.load
+
+        def _patched_torch_load(*args, **kwargs):
+            # Force weights_only=False to prevent meta tensor issues
+            if 'weights_only' not in kwargs:
+                kwargs['weights_only'] = False
+            return _original_torch_load(*args, **kwargs)
+
+        _torch.load = _patched_torch_load
+
+        print("✓ PyTorch patches applied")
+        print(f"✓ PyTorch version: {_torch.__version__}")
+
+        # NOW import transformers AFTER all patches are applied
+        with timed_phase("import_transformers"):
+            from transformers import pipeline as _pipeline
+            from transformers import SegformerImageProcessor as _processor_cls
+            from transformers import SegformerForSemanticSegmentation as _model_cls
+
+        print(f"✓ MPS available: {_torch.backends.mps.is_available()} (built: {_torch.backends.mps.is_built()})")
+
+        nn = _nn
+        pipeline = _pipeline
+        SegformerImageProcessor = _processor_cls
+        SegformerForSemanticSegmentation = _model_cls
+        # Assigned last: other threads treat a non-None torch as "backend ready"
+        torch = _torch
+
+
+def best_device():
+    load_backend()
     if (torch.cuda.is_available()):
-        device = "cuda"
+        return "cuda"
     elif (torch.backends.mps.is_available()):
-        device = "mps"
-    else:
-        device = "cpu"
-    pipe = pipeline(task="depth-estimation", model="depth-anything/Depth-Anything-V2-Metric-Indoor-Base-hf", use_fast=True, device = device)
-    image = Image.open(get_most_recent_file(f'{get_most_recent_dir("../storage/sessions/")}/frames'))
-    depth = pipe(image)["depth"]
-    image.convert("L")
-    depth.save(f"../face/{id}_depth.png")
-    return "completed"
-
-def get_feature(id, feature):
+        return "mps"
+    return "cpu"
+
+
+def get_depth_pipe(device=None):
+    """The depth pipeline, loaded on first use onto `device` (default: best_device())."""
+    global _depth_pipe
+    load_backend()
+    if _depth_pipe is None:
+        with _models_lock:
+            if _depth_pipe is None:
+                device = device or best_device()
+                with timed_phase("load_depth_model"):
+                    _depth_pipe = pipeline(task="depth-estimation", model=DEPTH_MODEL_ID, use_fast=True, device = device)
+                _apply_input_scale()
+    return _depth_pipe
+
+
+def get_face_parsing():
     global _face_parsing_model, _face_parsing_processor
+    load_backend()
 
     device = torch.device("cpu")  # Force CPU to avoid device issues
 
     # Use cached model if available to avoid reloading issues
     if _face_parsing_model is None or _face_parsing_processor is None:
-        print("Loading face parsing model for the first time...")
+        with _models_lock:
+            if _face_parsing_model is None or _face_parsing_processor is None:
+                print("Loading face parsing model for the first time...")
+                with timed_phase("load_face_parsing_model"):
+                    processor = SegformerImageProcessor.from_pretrained(FACE_PARSING_MODEL_ID)
 
-        _face_parsing_processor = SegformerImageProcessor.from_pretrained("jonathandinu/face-parsing")
+                    # Load model with transformers 4.45 - should work cleanly
+                    print("Loading face parsing model...")
+                    model = SegformerForSemanticSegmentation.from_pretrained(
+                        FACE_PARSING_MODEL_ID,
+                        torch_dtype=torch.float32
+                    )
 
-        # Load model with transformers 4.45 - should work cleanly
-        print("Loading face parsing model...")
-        _face_parsing_model = SegformerForSemanticSegmentation.from_pretrained(
-            "jonathandinu/face-parsing",
-            torch_dtype=torch.float32
-        )
+                    # Move to device and set to eval mode
+                    model = model.to(device)
+                    model.eval()
+                _face_parsing_processor = processor
+                _face_parsing_model = model
+                _apply_input_scale()
+                print(f"✓ Model loaded successfully on {device}")
 
-        # Move to device and set to eval mode
-        _face_parsing_model = _face_parsing_model.to(device)
-        _face_parsing_model.eval()
-        print(f"✓ Model loaded successfully on {device}")
-    else:
-        print("Using cached face parsing model")
+    return _face_parsing_model, _face_parsing_processor, device
+
+
+def warm_up(background=True, device=None, tune=True):
+    """
+    Import torch/transformers and load both models.
+
+    With background=True this returns immediately; use is_ready() or
+    startup_report() to see when the service can take inference requests.
+    The prefork parent passes device="cpu" and tune=False: CUDA/MPS state
+    doesn't survive fork and autotuning runs inference, so worker_warm_up()
+    does both in each worker instead.
+    """
+    global _warmup_thread
+
+    def _run():
+        global _warmup_error
+        try:
+            with timed_phase("warm_up_total"):
+                load_backend()
+                get_depth_pipe(device)
+                get_face_parsing()
+            if tune:
+                with timed_phase("autotune"):
+                    from autotune import startup_config
+                    configure_inference(**startup_config())
+            _ready.set()
+            print(f"✓ Warm-up finished: {STARTUP_TIMINGS}")
+        except Exception as e:
+            _warmup_error = str(e)
+            print(f"[ERROR] Warm-up failed: {e}")
+
+    if not background:
+        _run()
+        return None
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
 
-    model = _face_parsing_model
-    image_processor = _face_parsing_processor
 
-    # expects a PIL.Image or torch.Tensor
-    image = Image.open(get_most_recent_file(f'{get_most_recent_dir("../storage/sessions/")}/frames'))
+def worker_warm_up():
+    """Per-worker half of a prefork warm-up: device placement and the saved autotune config."""
+    device = best_device()
+    pipe = get_depth_pipe()
+    # Stand-in pipes (benchmark.py) have no model to move
+    if device != "cpu" and getattr(pipe, "model", None) is not None:
+        with timed_phase("place_depth_model"):
+            pipe.model.to(device)
+            pipe.device = torch.device(device)
+        print(f"✓ Depth model moved to {device} in worker {os.getpid()}")
+    with timed_phase("autotune"):
+        from autotune import startup_config, AUTOTUNE
+        if AUTOTUNE == "auto":
+            # N workers tuning at once would only measure each other
+            print("⚠️ AUTOTUNE=auto doesn't tune under prefork; run autotune.py once to save a config")
+        config = startup_config("off" if AUTOTUNE == "off" else "load")
+        # prefork already gave this worker its share of the cores
+        config.pop("threads", None)
+        configure_inference(**config)
+
+
+def _input_side(native, multiple):
+    return max(multiple, int(round(native * INPUT_SCALE / multiple)) * multiple)
+
+
+def _apply_input_scale():
+    # Stand-in models (benchmark.py) may not have a resizable processor
+    processor = getattr(_depth_pipe, "image_processor", None)
+    if processor is not None:
+        side = _input_side(DEPTH_INPUT_SIZE, 14)  # Depth-Anything patch size
+        processor.size = {"height": side, "width": side}
+    if _face_parsing_processor is not None:
+        side = _input_side(SEGMENTATION_INPUT_SIZE, 32)
+        _face_parsing_processor.size = {"height": side, "width": side}
+
+
+def configure_inference(threads=None, input_scale=None, segmentation_max_batch=None):
+    """Apply inference settings to the running process (autotune.py); None keeps the current value."""
+    global INPUT_SCALE, SEGMENTATION_MAX_BATCH
+    load_backend()
+    if threads:
+        torch.set_num_threads(int(threads))
+    if input_scale:
+        INPUT_SCALE = float(input_scale)
+        _apply_input_scale()
+    if segmentation_max_batch:
+        SEGMENTATION_MAX_BATCH = int(segmentation_max_batch)
+        _segmentation_batcher.max_batch = SEGMENTATION_MAX_BATCH
+    return inference_settings()
+
+
+def inference_settings():
+    return {
+        "threads": torch.get_num_threads() if torch is not None else None,
+        "input_scale": INPUT_SCALE,
+        "segmentation_max_batch": SEGMENTATION_MAX_BATCH,
+    }
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def startup_report():
+    return {
+        "ready": is_ready(),
+        "warming_up": _warmup_thread is not None and _warmup_thread.is_alive(),
+        "error": _warmup_error,
+        "timings": dict(STARTUP_TIMINGS),
+    }
+
+def load_latest_frame(session=None):
+    """Latest uploaded frame of `session` (a safe_name()d id), else of the most recently active session."""
+    with span("frame_lookup"):
+        session_dir = f"../storage/sessions/{session}" if session else get_most_recent_dir("../storage/sessions/")
+        frame_path = get_most_recent_file(f'{session_dir}/frames')
+    return get_frame(frame_path)
+
+def get_depth(id, frame=None, save_artifacts=True):
+    """Run depth estimation on `frame` (default: latest uploaded frame); returns the (H, W) uint8 depth map."""
+    pipe = get_depth_pipe()
+    if frame is None:
+        frame = load_latest_frame()
+    with span("depth_inference"), _inference_slots, torch.inference_mode():
+        depth = pipe(frame.image)["depth"]
+    if depth.mode != "L":
+        depth = depth.convert("L")
+    if save_artifacts:
+        with span("mask_io"):
+            depth.save(f"../face/{id}_depth.png")
+    return np.asarray(depth)
+
+def segment_labels(frame):
+    """Face-parsing label of every pixel of `frame`; (H, W) uint8."""
+    get_face_parsing()
 
     # run inference on image
-    inputs = image_processor(images=image, return_tensors="pt", use_fast=True).to(device)
-    outputs = model(**inputs)
-    logits = outputs.logits 
-
-    # resize output to match input image dimensions
-    upsampled_logits = nn.functional.interpolate(logits,
-                    size=image.size[::-1], # H x W
-                    mode='bilinear',
-                    align_corners=False)
-
-    # get label masks
-    labels = upsampled_logits.argmax(dim=1)[0]
-
-    # Debug: Check what labels we're getting
-    unique_labels = torch.unique(labels)
-    print(f"Feature {feature}: Unique labels found in image: {unique_labels.tolist()}")
-
-    # move to CPU to visualize in matplotlib
-    print(feature)
-    labels_viz = (labels.cpu().numpy() == int(feature)).astype(np.uint8)*255
-
-    # Debug: Check if we found the feature
-    feature_pixels = np.sum(labels_viz > 0)
-    print(f"Feature {feature}: Found {feature_pixels} pixels")
-    img = Image.fromarray(labels_viz, 'L')
-    img.save(f"../face/{id}_{feature}_feature.png", "PNG")
-    return "finished"
+    with span("segmentation_inference"):
+        logits = _segmentation_batcher.submit(frame)
+
+    with span("upsample_argmax"), torch.inference_mode():
+        return upsample_labels(logits, frame.size[::-1])  # H x W
+
+def upsample_labels(logits, size):
+    """
+    argmax over classes of `logits` (1, C, h, w) bilinearly resized to `size` (H, W).
+
+    Gives the same labels as interpolating the whole tensor first, but only
+    UPSAMPLE_BAND_ROWS output rows of float32 logits exist at a time.
+    """
+    _, _, h, _ = logits.shape
+    height, width = size
+    labels = np.empty((height, width), dtype=np.uint8)
+    scale = h / height
+    for y0 in range(0, height, UPSAMPLE_BAND_ROWS):
+        y1 = min(height, y0 + UPSAMPLE_BAND_ROWS)
+        # Source rows each output row blends (align_corners=False), as interpolate computes them
+        src = ((torch.arange(y0, y1, dtype=torch.float32) + 0.5) * scale - 0.5).clamp(min=0)
+        top = src.long()
+        bottom = (top + 1).clamp(max=h - 1)
+        frac = (src - top).view(1, 1, -1, 1)
+        r0, r1 = int(top[0]), int(bottom[-1]) + 1
+        # Width pass on just those rows (height unchanged), then the height blend
+        rows = nn.functional.interpolate(logits[:, :, r0:r1], size=(r1 - r0, width),
+                        mode='bilinear',
+                        align_corners=False)
+        band = rows[:, :, top - r0].mul_(1 - frac)
+        band.add_(rows[:, :, bottom - r0].mul_(frac))
+        labels[y0:y1] = band.argmax(dim=1)[0].numpy()
+    return labels
+
+def feature_mask(labels, feature):
+    return (labels == int(feature)).astype(np.uint8) * 255
+
+def get_feature(id, feature, frame=None, save_artifacts=True, labels=None):
+    """Segment `feature` (face-parsing label) in `frame`; returns the (H, W) uint8 0/255 mask."""
+    if labels is None:
+        if frame is None:
+            frame = load_latest_frame()
+        labels = segment_labels(frame)
+    labels_viz = feature_mask(labels, feature)
+
+    if save_artifacts:
+        with span("mask_io"):
+            img = Image.fromarray(labels_viz, 'L')
+            img.save(f"../face/{id}_{feature}_feature.png", "PNG")
+    return labels_viz
+
+def segment_batch(frames):
+    """Face-parsing logits for several frames in one forward pass; one (1, C, h, w) tensor per frame."""
+    with _inference_slots:
+        return _segment_batch(frames)
+
+def _segment_batch(frames):
+    # The caller holds an inference slot (the batcher takes it before running)
+    model, image_processor, device = get_face_parsing()
+    with torch.inference_mode():
+        inputs = image_processor(images=[f.image for f in frames], return_tensors="pt", use_fast=True).to(device)
+        logits = model(**inputs).logits
+    return [logits[i:i + 1] for i in range(len(frames))]
+
+_segmentation_batcher = MicroBatcher(_segment_batch, window_ms=BATCH_WINDOW_MS,
+                                     max_batch=SEGMENTATION_MAX_BATCH, slots=_inference_slots)
+
+def inference_backlog():
+    """Model calls waiting: segmentation requests not yet batched plus callers blocked on a slot."""
+    return _segmentation_batcher.queued() + _inference_slots.waiting
+
+def inference_stats():
+    return {"slots": INFERENCE_SLOTS, "settings": inference_settings(), "backlog": inference_backlog(), "segmentation_batching": _segmentation_batcher.stats()}
 
 def get_most_recent_file(directory_path):
 
@@ -1,73 +1,370 @@
-import cv2
+import os
 import numpy as np
-from flask import Flask, request, jsonify
-from get_depth import get_depth, get_feature
+from flask import Flask, Response, request, jsonify
+from get_depth import get_depth, get_feature, segment_labels, load_latest_frame, warm_up, worker_warm_up, is_ready, startup_report, inference_stats
 from flask_cors import CORS
+from stage_timing import span, render_prometheus
+from posture_tracker import get_tracker, MIN_PLANE_PIXELS
+from calibration import get_calibration, DEFAULT_PARAMS
+from result_cache import result_cache, FEATURES
+from frame_cache import decode_frame_bytes, cache_info
+from cascade import cheap_view, session_state, record, cascade_stats, CASCADE_ENABLED
+from analyze import safe_name, decode_frame_data, store_frame, record_sample, wants_feedback, request_feedback, FEEDBACK_MODES
+from export import stream_ipc, load_arrow, parse_day, DATASETS, ARROW_STREAM_MIMETYPE
+from profiling import register_profiling, admin_only
+from capture_rate import load_gauge, recommend
+import time
 import math
+# Plane fitting for compute_rolls: "pca" (all pixels) or "irls" (robust, fixed point budget)
+PLANE_FIT_METHOD = os.environ.get("PLANE_FIT_METHOD", "pca")
+PLANE_POINT_BUDGET = 2048
+IRLS_ITERATIONS = 5
+# Mask-quality confidence: a region scores 1 when its mask covers this share of
+# the frame, its plane residual is well under RESIDUAL_SCALE and its depth
+# spread is well under DEPTH_STD_SCALE (depth-map levels, 0-255)
+FULL_AREA_FRACTION = {"face": 0.02, "neck": 0.004, "chest": 0.05}
+RESIDUAL_SCALE = 6.0
+DEPTH_STD_SCALE = 30.0
+# Below this, /api/analyze skips logging and feedback and asks for a retry
+CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.3"))
 # Paths to images
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+register_profiling(app)
 @app.route('/api/get_metrics', methods=['GET'])
 def compute_torsion_id():
-    id = request.args.get('id')
-    get_depth(id)
-    get_feature(id, 1)
-    get_feature(id, 2)
-    get_feature(id, 18)
-    depth_img = cv2.imread(f"../face/{id}_depth.png")
-    face_mask = cv2.imread(f"../face/{id}_{1}_feature.png")
-    neck_mask = cv2.imread(f"../face/{id}_{2}_feature.png")
-    chest_mask = cv2.imread(f"../face/{id}_{18}_feature.png")
+    with span("request_total"):
+        load_gauge.sample()
+        id = request.args.get('id')
+        session_id = request.args.get('session')
+        try:
+            session_dir = safe_name(session_id) if session_id else None
+        except ValueError:
+            return jsonify({"error": "Invalid session"}), 400
+        # Frames live in storage/sessions/{session}/frames; without ?session the most recent one is used
+        frame = load_latest_frame(session_dir)
+        session_id = session_id or os.path.basename(os.path.dirname(os.path.dirname(frame.path)))
+        tracker = None if request.args.get('smooth') == '0' else get_tracker(session_id)
+        # Baselines are per session unless the client names a user to carry them across sessions
+        calibration = None if request.args.get('calibrate') == '0' else get_calibration(request.args.get('user') or session_id)
+        cascade = request.args.get('cascade', '1' if CASCADE_ENABLED else '0') == '1'
+        metric_dict = compute_metrics(id, frame, tracker=tracker, calibration=calibration, cascade=cascade)
+        next_capture, capture_reason = recommend(tracker)
+    return jsonify({**metric_dict, "next_capture_seconds": next_capture, "capture_reason": capture_reason})
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_frame():
+    """
+    One round trip per frame: store, score, log and (optionally) explain it.
+
+    JSON body: {frameData, sessionId, frameNumber, user?, feedback?: auto|bad|never, store?, cascade?}
+    """
+    with span("request_total"):
+        load_gauge.sample()
+        started = time.perf_counter()
+        body = request.get_json(silent=True) or {}
+        session_id = body.get('sessionId')
+        frame_number = body.get('frameNumber')
+        mode = body.get('feedback', 'auto')
+        if not body.get('frameData') or not session_id or frame_number is None:
+            return jsonify({"error": "Missing required fields"}), 400
+        if mode not in FEEDBACK_MODES:
+            return jsonify({"error": f"feedback must be one of {FEEDBACK_MODES}"}), 400
+        try:
+            safe_name(session_id)
+        except ValueError:
+            return jsonify({"error": "Invalid sessionId"}), 400
+        try:
+            data = decode_frame_data(body['frameData'])
+            name = f"analyze:{session_id}/{frame_number}"
+            if body.get('store', True):
+                name = str(store_frame(session_id, frame_number, data))
+            frame = decode_frame_bytes(data, name)
+        except Exception as e:
+            return jsonify({"error": f"Bad frame: {e}"}), 400
+
+        user = body.get('user')
+        tracker = get_tracker(session_id)
+        calibration = get_calibration(user or session_id)
+        cascade = bool(body.get('cascade', CASCADE_ENABLED))
+        metric_dict = compute_metrics(frame_number, frame, tracker=tracker, calibration=calibration, cascade=cascade)
+
+        # Unreliable masks: don't log garbage or spend an LLM call on it; the client retries
+        low_confidence = metric_dict["confidence"] < CONFIDENCE_THRESHOLD
+        feedback, source = None, None
+        if not low_confidence:
+            record_sample(metric_dict, user)
+            if wants_feedback(metric_dict, mode):
+                feedback, source = request_feedback(metric_dict)
+        next_capture, capture_reason = recommend(tracker)
+    return jsonify({
+        "frameNumber": frame_number,
+        "metrics": metric_dict,
+        "low_confidence": low_confidence,
+        "retry": low_confidence,
+        "feedback": feedback,
+        "feedback_source": source,
+        "next_capture_seconds": next_capture,
+        "capture_reason": capture_reason,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+def run_models(frame):
+    # Decode the frame once and share it with every stage; the depth map and
+    # masks come back in memory. result_cache persists them under content-addressed names.
+    # One segmentation pass labels every pixel; each feature mask is cut from it.
+    outputs = {"depth": get_depth(None, frame, save_artifacts=False)}
+    labels = segment_labels(frame)
+    for feature in FEATURES:
+        outputs[feature] = get_feature(None, feature, save_artifacts=False, labels=labels)
+    return outputs
+
+def compute_metrics(id, frame, save_artifacts=True, tracker=None, calibration=None, cascade=False):
+    # The cascade needs a session to compare against; without a tracker every frame is "full"
+    view = None
+    if cascade and tracker is not None:
+        view = cheap_view(frame)
+        with tracker.lock:
+            state = session_state(tracker)
+            easy, reason = state.decide(view)
+            record(reason)
+            if easy:
+                return state.reuse()
+
+    outputs = result_cache.get_or_compute(frame, run_models, persist=save_artifacts)
+    depth_img = outputs["depth"][:, :, None]
+    face_mask = outputs[1][:, :, None]
+    neck_mask = outputs[2][:, :, None]
+    chest_mask = outputs[18][:, :, None]
+    with span("metric_math"):
+        if tracker is None:
+            metric_dict = score_frame(depth_img, face_mask, neck_mask, chest_mask, calibration=calibration)
+            observe_calibration(metric_dict, calibration)
+            return metric_dict
+        with tracker.lock:
+            metric_dict = score_frame(depth_img, face_mask, neck_mask, chest_mask, tracker, calibration)
+            if metric_dict["confidence"] < CONFIDENCE_THRESHOLD:
+                # Unreliable masks must not move the session's smoothing, planes or cascade reference
+                tracker.hold(metric_dict)
+                return metric_dict
+            observe_calibration(metric_dict, calibration)
+            tracker.update(metric_dict, is_correct)
+            if view is not None:
+                metric_dict["tier"] = "full"
+                session_state(tracker).remember(view, metric_dict)
+            return metric_dict
+
+def fit_region(depth_img, mask, region, tracker=None, quality=None):
+    # Reuse the session's previous plane when this frame's mask is too small to
+    # fit; with no previous plane report a level one rather than fit noise
+    area = compute_area(mask)
+    stats = {"area": area}
+    if quality is not None:
+        quality[region] = stats
+    if area < MIN_PLANE_PIXELS:
+        previous = tracker.previous_plane(region) if tracker is not None else None
+        return previous if previous is not None else (0.0, 0.0)
+    init_normal = tracker.previous_normal(region) if tracker is not None else None
+    normal = fit_plane(depth_img, mask, init_normal=init_normal, stats=stats)
+    roll, pitch = normal_to_angles(normal)
+    if tracker is not None:
+        tracker.record_plane(region, roll, pitch, normal)
+    return roll, pitch
+
+def observe_calibration(metric_dict, calibration):
+    # Calibration's only confidence gate; it never looks at the posture verdict
+    if calibration is not None and not calibration.complete and metric_dict["confidence"] >= CONFIDENCE_THRESHOLD:
+        calibration.observe(metric_dict)
+
+def score_frame(depth_img, face_mask, neck_mask, chest_mask, tracker=None, calibration=None):
+    params = calibration.params if calibration is not None else DEFAULT_PARAMS
     metric_dict = {}
-    metric_dict["chest_roll"], metric_dict["chest_pitch"] = compute_rolls(depth_img, chest_mask)
-    metric_dict["neck_roll"], metric_dict["neck_pitch"] = compute_rolls(depth_img, neck_mask)
-    metric_dict["face_roll"], metric_dict["face_pitch"] = compute_rolls(depth_img, face_mask)
-    metric_dict["face_dist"] = compute_avg_dist(depth_img, face_mask)
-    metric_dict["chest_dist"] = compute_avg_dist(depth_img, chest_mask)
+    quality = {}
+    metric_dict["chest_roll"], metric_dict["chest_pitch"] = fit_region(depth_img, chest_mask, "chest", tracker, quality)
+    metric_dict["neck_roll"], metric_dict["neck_pitch"] = fit_region(depth_img, neck_mask, "neck", tracker, quality)
+    metric_dict["face_roll"], metric_dict["face_pitch"] = fit_region(depth_img, face_mask, "face", tracker, quality)
+    # An empty region keeps the session's last distance, like fit_region keeps its plane
+    previous = tracker.state if tracker is not None else {}
+    metric_dict["face_dist"] = compute_avg_dist(depth_img, face_mask, previous.get("face_dist", 0.0))
+    metric_dict["chest_dist"] = compute_avg_dist(depth_img, chest_mask, previous.get("chest_dist", 0.0))
     metric_dict["depth_diff"] = metric_dict["chest_dist"] - metric_dict["face_dist"]
     metric_dict["neck_area"] = compute_area(neck_mask)
-    metric_dict["eye_strain"] = get_eye_strain(metric_dict["face_dist"])
-    metric_dict["neck_strain"] = get_neck_strain(metric_dict["face_pitch"], metric_dict["neck_area"])
+    metric_dict["eye_strain"] = get_eye_strain(metric_dict["face_dist"], params["eye_scale"])
+    metric_dict["neck_strain"] = get_neck_strain(metric_dict["face_pitch"], metric_dict["neck_area"], params["neck_offset"])
     metric_dict["posture"] = int(is_correct(metric_dict))
-    return jsonify(metric_dict)
+    metric_dict["confidence"], metric_dict["confidence_regions"] = compute_confidence(quality, depth_img.shape[0] * depth_img.shape[1])
+    if calibration is not None:
+        metric_dict["calibrated"] = calibration.complete
+    return metric_dict
+
+@app.route('/api/calibration', methods=['GET', 'DELETE'])
+def calibration_status():
+    key = request.args.get('user') or request.args.get('session')
+    if not key:
+        return jsonify({"error": "user or session is required"}), 400
+    calibration = get_calibration(key)
+    if request.method == 'DELETE':
+        calibration.reset()
+    return jsonify(calibration.status())
+
+@app.route('/health', methods=['GET'])
+def health():
+    # Never touches torch, so it answers even while models are loading
+    return jsonify({"status": "ok", "ready": is_ready()})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    report = startup_report()
+    report["result_cache"] = result_cache.info()
+    report["frame_cache"] = cache_info()
+    report["inference"] = inference_stats()
+    report["cascade"] = cascade_stats()
+    return jsonify(report), (200 if report["ready"] else 503)
 
-def compute_rolls(depth_img, depth_mask):
-    print(depth_mask.shape)
+@app.route('/api/export', methods=['GET'])
+@admin_only
+def export_history():
+    # Arrow IPC stream of posture samples or full metric dicts, one record batch at a time.
+    # Every user's history, so admin-only like /admin/profile
+    dataset = request.args.get('dataset', 'samples')
+    if dataset not in DATASETS:
+        return jsonify({"error": f"dataset must be one of {DATASETS}"}), 400
+    try:
+        since, until = (parse_day(request.args[k]) if request.args.get(k) else None for k in ('since', 'until'))
+    except ValueError:
+        return jsonify({"error": "since/until must be YYYY-MM-DD"}), 400
+    try:
+        load_arrow()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    users = request.args.getlist('user') or None
+    stream = stream_ipc(dataset, users, since, until)
+    filename = f"posture_{dataset}.arrows"
+    return Response(stream, mimetype=ARROW_STREAM_MIMETYPE,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+def compute_rolls(depth_img, depth_mask, method=None, init_normal=None):
+    return normal_to_angles(fit_plane(depth_img, depth_mask, method, init_normal))
+
+def compute_confidence(quality, frame_pixels):
+    """
+    Frame confidence in [0, 1] from per-region mask area, plane residual and depth spread.
+
+    Each region scores area * fit * depth; the frame gets their geometric
+    mean, so one empty or unfittable region pulls the whole frame down.
+    """
+    regions = {}
+    for region, stats in quality.items():
+        area_score = min(1.0, stats["area"] / (FULL_AREA_FRACTION[region] * frame_pixels))
+        if "residual" not in stats:
+            # Not fitted this frame (mask too small)
+            regions[region] = round(area_score * 0.5, 3)
+            continue
+        fit_score = 1.0 / (1.0 + (stats["residual"] / RESIDUAL_SCALE) ** 2)
+        depth_score = 1.0 / (1.0 + (stats["depth_std"] / DEPTH_STD_SCALE) ** 2)
+        regions[region] = round(area_score * fit_score * depth_score, 3)
+    if not regions:
+        return 0.0, regions
+    confidence = float(np.prod(list(regions.values())) ** (1.0 / len(regions)))
+    return round(confidence, 3), regions
+
+def fit_plane(depth_img, depth_mask, method=None, init_normal=None, stats=None):
+    """
+    Unit normal of the plane through the masked depth pixels.
+
+    method="pca" fits every masked pixel. method="irls" fits at most
+    PLANE_POINT_BUDGET evenly strided pixels with iteratively reweighted least
+    squares, so mask edge bleed and depth outliers are down-weighted and the
+    solve costs the same for any mask size. `init_normal` (e.g. the previous
+    frame's plane) seeds the first IRLS weights. If `stats` is given, the fit's
+    RMS residual and depth spread are stored in it for compute_confidence.
+    """
+    method = method or PLANE_FIT_METHOD
     y, x = np.nonzero(depth_mask[:,:,0])
-    z = depth_img.mean(axis = -1)[y,x]
+    if method == "irls" and len(y) > PLANE_POINT_BUDGET:
+        keep = np.linspace(0, len(y) - 1, PLANE_POINT_BUDGET).astype(np.intp)
+        y, x = y[keep], x[keep]
+    z = depth_img[y,x].mean(axis = -1)
     x = x.astype(np.float64)
     y = y.astype(np.float64)
     z = z.astype(np.float64)
     x = x - x.mean()
     y = y - y.mean()
     pts = np.stack((x, y, z), axis = 1)
-    print(pts.shape)
+    if method == "irls":
+        return _fit_normal_irls(pts, init_normal, stats=stats)
     centered = pts - pts.mean(axis = 0)
     cov = np.cov(centered, rowvar=False)
     eigvals, eigvecs = np.linalg.eigh(cov)
     normal = eigvecs[:, np.argmin(eigvals)]
-    normal /= np.linalg.norm(normal)
+    if stats is not None:
+        _record_fit(stats, eigvals, cov)
+    return _face_camera(normal)
 
+def _face_camera(normal):
+    # eigh's sign is arbitrary; face the camera so roll/pitch don't flip between ~x and ~180-x
+    if normal[2] < 0:
+        normal = -normal
+    return normal / np.linalg.norm(normal)
+
+def _record_fit(stats, eigvals, cov):
+    # Smallest eigenvalue: variance across the plane; cov[2, 2]: variance of depth
+    stats["residual"] = float(np.sqrt(max(eigvals.min(), 0.0)))
+    stats["depth_std"] = float(np.sqrt(max(cov[2, 2], 0.0)))
+
+def _cauchy_weights(residuals):
+    # Robust scale from the median absolute residual; 2.385 gives 95% efficiency
+    scale = 2.385 * 1.4826 * np.median(residuals) + 1e-9
+    return 1.0 / (1.0 + (residuals / scale) ** 2)
+
+def _fit_normal_irls(pts, init_normal=None, iterations=None, stats=None):
+    weights = np.ones(len(pts))
+    if init_normal is not None:
+        weights = _cauchy_weights(np.abs((pts - pts.mean(axis = 0)) @ init_normal))
+    normal = init_normal
+    for _ in range(iterations or IRLS_ITERATIONS):
+        total = weights.sum()
+        center = (weights[:, None] * pts).sum(axis = 0) / total
+        centered = pts - center
+        cov = (weights[:, None] * centered).T @ centered / total
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        normal = eigvecs[:, np.argmin(eigvals)]
+        weights = _cauchy_weights(np.abs(centered @ normal))
+    if stats is not None:
+        _record_fit(stats, eigvals, cov)
+    return _face_camera(normal)
+
+def normal_to_angles(normal):
     nx, ny, nz = normal
     pitch = np.arctan2(ny, nz)*(180/math.pi)
     roll  = np.arctan2(nx, nz)*(180/math.pi)
     pitch = min(abs(pitch), abs(pitch+180), abs(pitch-180))
-    roll = min(abs(roll), abs(roll+180), abs(pitch-180))
+    roll = min(abs(roll), abs(roll+180), abs(roll-180))
     return roll, pitch
 
-def compute_avg_dist(depth_img, depth_mask):
+def compute_avg_dist(depth_img, depth_mask, default=0.0):
     y, x = np.nonzero(depth_mask[:,:,0])
+    if len(y) == 0:
+        # Empty mask (nobody in frame): the mean would be NaN
+        return default
     z = depth_img.mean(axis = -1)[y,x]
-    return z.mean()
+    return float(z.mean())
 def compute_area(depth_mask):
     return len(np.nonzero(depth_mask[:,:,0])[0])
 
-def get_neck_strain(face_pitch, neck_area):
-    ans = max(0, 2*face_pitch - neck_area/2000)
+def get_neck_strain(face_pitch, neck_area, offset=0.0):
+    ans = max(0, 2*face_pitch - neck_area/2000 + offset)
     return ans
 
-def get_eye_strain(face_depth):
-    ans = 40/(face_depth/5)
+def get_eye_strain(face_depth, scale=40):
+    if not face_depth > 0:
+        # No face distance to judge by
+        return 0.0
+    ans = scale/(face_depth/5)
     return ans
 def is_correct(metric_dict):
     if (metric_dict["eye_strain"] > 5):
@@ -86,4 +383,23 @@ def handle_options(response):
     return response
 # Run
 if __name__ == '__main__':
-    app.run(host="0.0.0.0",port=5500, debug=True)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Posture metrics service")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Prefork N production workers sharing preloaded models (0 = dev server)")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="Torch intra-op threads per worker (default: cores // workers)")
+    parser.add_argument("--port", type=int, default=5500)
+    args = parser.parse_args()
+
+    if args.workers > 0:
+        from prefork import serve_prefork
+
+        serve_prefork(app, "0.0.0.0", args.port, args.workers,
+                      preload=lambda: warm_up(background=False, device="cpu", tune=False),
+                      torch_threads=args.torch_threads, post_fork=worker_warm_up)
+    else:
+        # With debug=True the reloader parent only watches files; warm up in the serving child
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            warm_up(background=True)
+        app.run(host="0.0.0.0",port=args.port, debug=True)
@@ -0,0 +1,429 @@
+"""
+Concurrent load generator for the posture services.
+
+Simulated users capture a synthetic frame every --interval seconds, as
+PosturePalRoom does. Each user waits for the previous frame before sending
+the next one. Frames go through one of three flows (--flow):
+
+    analyze  POST /api/analyze on the metrics service, the client's current path.
+             The service stores the frame, logs it to the dashboard and asks for
+             feedback itself.
+    split    one request per service, so each is timed on its own: upload-frame
+             (Next.js), get_metrics, dashboard ingest (/api/app.py) and, when
+             --feedback asks for it, ai_feedback
+    stream   Socket.IO frames to stream_ingest.py, timed until the "metrics" event
+
+Every request carries a frame no one has sent before: a pool frame with the
+request counter stamped into its top row. The content-addressed result cache
+therefore never hits and the run measures inference. --repeat-frames cycles
+the pre-encoded pool instead, which measures the cache-hit path. Each user
+has its own session id, so get_metrics in the split flow reads that user's
+frames.
+
+--subscribers dashboard Socket.IO clients run alongside the users. They count
+"update" events and time them from the last sample a user sent.
+
+Users arrive as a Poisson process at --arrival-rate per second. --users
+1,4,16,64 runs one stage per level. The report says where each step
+saturates: throughput stops growing, p90 goes over --slo-ms, or more than
+1% of requests fail.
+
+--stub-llm PORT starts a fake LLM with --llm-latency-ms of delay. It serves
+the Letta messages API for ai_feedback.py (run that with
+LETTA_BASE_URL=http://localhost:PORT) and /api/ai_feedback itself (point
+get_metrics at it with FEEDBACK_URL=http://localhost:PORT).
+
+    python load_test.py --users 1,4,16 --duration 30
+    python load_test.py --flow split --users 8 --subscribers 4 --stub-llm 5900 --feedback bad
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import aiohttp
+import numpy as np
+import socketio
+from aiohttp import web
+from PIL import Image
+
+from analyze import DASHBOARD_URL, FEEDBACK_URL, FEEDBACK_MODES, wants_feedback
+from benchmark import SEED, _percentiles, synthetic_frame
+
+METRICS_URL = os.environ.get("METRICS_URL", "http://localhost:5500")
+UPLOAD_URL = os.environ.get("UPLOAD_URL", "http://localhost:3000")
+STREAM_URL = os.environ.get("STREAM_URL", "http://localhost:5600")
+FLOWS = ("analyze", "split", "stream")
+FRAME_POOL_SIZE = 16
+MAX_ERROR_RATE = 0.01
+MIN_SCALING = 1.1       # throughput must grow at least this much per level
+
+# Payload encodings /api/app.py accepts; ingest rotates through them so the
+# parser's fallbacks are exercised under load too
+INGEST_FORMATS = ("json", "json_string", "python_dict", "query_string")
+
+STUB_FEEDBACK = (
+    "Sit back so your ears line up with your shoulders.",
+    "Raise your screen a little and relax your neck.",
+    "You're leaning in - slide your chair closer instead.",
+)
+
+
+def encode_jpeg(image):
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+class FramePool:
+    """Synthetic frames for the users; unique per request unless `repeat`."""
+
+    STAMP_BITS = 32
+    STAMP_PIXELS = 4    # stamp cell width, wide enough to survive JPEG
+
+    def __init__(self, count=FRAME_POOL_SIZE, seed=SEED, repeat=False):
+        rng = np.random.default_rng(seed)
+        self.images = [np.asarray(synthetic_frame(rng)) for _ in range(count)]
+        self.repeat = repeat
+        self.encoded = [encode_jpeg(Image.fromarray(a)) for a in self.images] if repeat else None
+        self._counter = itertools.count(1)
+
+    def next(self, index):
+        """JPEG bytes of the pool frame at `index`, stamped with a fresh counter."""
+        if self.repeat:
+            return self.encoded[index % len(self.encoded)]
+        n = next(self._counter)
+        arr = self.images[index % len(self.images)].copy()
+        width = self.STAMP_PIXELS
+        for bit in range(self.STAMP_BITS):
+            arr[:width, bit * width:(bit + 1) * width] = 255 if n >> bit & 1 else 0
+        return encode_jpeg(Image.fromarray(arr))
+
+
+def data_url(jpeg):
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+
+
+def ingest_body(metrics, user, n):
+    fields = {
+        "neck-strain": round(float(metrics.get("neck_strain", 0)), 2),
+        "eye-strain": round(float(metrics.get("eye_strain", 0)), 2),
+        "posture": int(metrics.get("posture", 0)),
+        "user": user,
+    }
+    fmt = INGEST_FORMATS[n % len(INGEST_FORMATS)]
+    if fmt == "json":
+        return {"json": fields}
+    if fmt == "json_string":
+        return {"data": json.dumps(fields)}
+    if fmt == "python_dict":
+        return {"data": repr(fields)}
+    return {"data": "&".join(f"{k}={v}" for k, v in fields.items())}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.last_sample = None
+
+    async def measure(self, step, coro):
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except Exception as e:
+            self.errors[step][type(e).__name__] += 1
+            return None
+        self.latencies[step].append(time.perf_counter() - start)
+        return result
+
+    def observe(self, step, seconds):
+        self.latencies[step].append(seconds)
+
+    def report(self, elapsed):
+        steps = {}
+        for step in sorted(set(self.latencies) | set(self.errors)):
+            ok = len(self.latencies[step])
+            failed = sum(self.errors[step].values())
+            total = ok + failed
+            steps[step] = {
+                "requests": total,
+                "errors": failed,
+                "error_rate": round(failed / total, 4) if total else 0.0,
+                "error_types": dict(self.errors[step]),
+                "throughput_per_sec": round(ok / elapsed, 3),
+                "latency": _percentiles(self.latencies[step]) if ok else None,
+            }
+        return steps
+
+
+async def _json(response):
+    response.raise_for_status()
+    return await response.json(content_type=None)
+
+
+async def post_json(http, url, payload):
+    async with http.post(url, json=payload) as response:
+        return await _json(response)
+
+
+async def get_json(http, url, params=None):
+    async with http.get(url, params=params) as response:
+        return await _json(response)
+
+
+# ---------------------------------------------------------------------------
+# Flows
+# ---------------------------------------------------------------------------
+
+class SimulatedUser:
+    def __init__(self, index, stage, args, frames, http, recorder):
+        self.user = f"load{index}"
+        self.session_id = f"load-{stage}-{index}-{int(time.time())}"
+        self.args = args
+        self.frames = frames
+        self.http = http
+        self.recorder = recorder
+        self.frame_number = 0
+        self.socket = None
+        self.pending = {}
+
+    def next_frame(self):
+        self.frame_number += 1
+        return self.frames.next(self.frame_number)
+
+    async def analyze(self):
+        body = {
+            "frameData": data_url(self.next_frame()),
+            "sessionId": self.session_id,
+            "frameNumber": self.frame_number,
+            "user": self.user,
+            "feedback": self.args.feedback,
+            "store": not self.args.no_store,
+        }
+        result = await self.recorder.measure("analyze", post_json(self.http, f"{self.args.metrics_url}/api/analyze", body))
+        if result is not None and not result.get("low_confidence"):
+            self.recorder.last_sample = time.perf_counter()
+
+    async def split(self):
+        args, rec = self.args, self.recorder
+        body = {
+            "frameData": data_url(self.next_frame()),
+            "sessionId": self.session_id,
+            "frameNumber": self.frame_number,
+            "timestamp": int(time.time() * 1000),
+        }
+        if await rec.measure("upload", post_json(self.http, f"{args.upload_url}/api/upload-frame", body)) is None:
+            return
+        params = {"id": self.frame_number, "session": self.session_id, "user": self.user}
+        metrics = await rec.measure("metrics", get_json(self.http, f"{args.metrics_url}/api/get_metrics", params))
+        if metrics is None:
+            return
+        kwargs = ingest_body(metrics, self.user, self.frame_number)
+        if await rec.measure("ingest", self._ingest(kwargs)) is not None:
+            rec.last_sample = time.perf_counter()
+        if wants_feedback(metrics, args.feedback):
+            await rec.measure("feedback", post_json(self.http, f"{args.feedback_url}/api/ai_feedback", metrics))
+
+    async def _ingest(self, kwargs):
+        async with self.http.post(f"{self.args.dashboard_url}/api/app.py", **kwargs) as response:
+            return await _json(response)
+
+    async def stream(self):
+        if self.socket is None:
+            self.socket = socketio.AsyncClient(reconnection=False, http_session=self.http)
+            self.socket.on("metrics", self._on_metrics)
+            self.socket.on("stream_error", self._on_stream_error)
+            await self.recorder.measure("stream_connect", self.socket.connect(self.args.stream_url, wait_timeout=10))
+        if not self.socket.connected:
+            self.socket = None
+            return
+        jpeg = self.next_frame()
+        frame_number = self.frame_number
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending[frame_number] = waiter
+        meta = {"sessionId": self.session_id, "frameNumber": frame_number, "format": "jpeg"}
+        try:
+            await self.socket.emit("frame", (meta, jpeg))
+            await self.recorder.measure("stream", asyncio.wait_for(waiter, self.args.timeout))
+        finally:
+            self.pending.pop(frame_number, None)
+
+    async def _on_metrics(self, metrics):
+        # A frame dropped by the latest-wins queue never answers; its wait times out
+        waiter = self.pending.get(metrics.get("frame_number"))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(metrics)
+
+    async def _on_stream_error(self, error):
+        waiter = self.pending.get(error.get("frameNumber"))
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(RuntimeError(error.get("error")))
+
+    async def run(self, stop_at):
+        step = getattr(self, self.args.flow)
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            await step()
+            await asyncio.sleep(max(0.0, self.args.interval - (time.perf_counter() - started)))
+        if self.socket is not None and self.socket.connected:
+            await self.socket.disconnect()
+
+
+async def subscriber(args, http, recorder, stop_at):
+    client = socketio.AsyncClient(reconnection=False, http_session=http)
+
+    async def on_update(data):
+        if recorder.last_sample is not None:
+            recorder.observe("subscriber_updates", time.perf_counter() - recorder.last_sample)
+
+    client.on("update", on_update)
+    if await recorder.measure("subscriber_connect", client.connect(args.dashboard_url, wait_timeout=10)) is None:
+        return
+    await asyncio.sleep(max(0.0, stop_at - time.perf_counter()))
+    await client.disconnect()
+
+
+async def run_stage(args, level, frames):
+    recorder = Recorder()
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # limit=0: the generator must not become the bottleneck it is looking for
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=0)) as http:
+        tasks = [asyncio.create_task(subscriber(args, http, recorder, stop_at)) for _ in range(args.subscribers)]
+        for i in range(level):
+            user = SimulatedUser(i, level, args, frames, http, recorder)
+            tasks.append(asyncio.create_task(user.run(stop_at)))
+            if args.arrival_rate > 0:
+                await asyncio.sleep(random.expovariate(args.arrival_rate))
+            if time.perf_counter() >= stop_at:
+                break
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {"users": level, "seconds": round(elapsed, 2), "steps": recorder.report(elapsed)}
+
+
+def find_saturation(stages, slo_ms):
+    """First user level at which each step stops scaling, breaks its SLO or starts failing."""
+    result = {}
+    previous = {}
+    for stage in stages:
+        for step, s in stage["steps"].items():
+            if step in result or step.endswith("_connect"):
+                continue
+            reason = None
+            if s["error_rate"] > MAX_ERROR_RATE:
+                reason = f"error rate {s['error_rate']:.1%}"
+            elif s["latency"] and s["latency"]["p90_ms"] > slo_ms:
+                reason = f"p90 {s['latency']['p90_ms']:.0f} ms > {slo_ms:.0f} ms"
+            elif step in previous and s["throughput_per_sec"] < previous[step] * MIN_SCALING:
+                reason = f"throughput {previous[step]:.2f} -> {s['throughput_per_sec']:.2f}/s"
+            if reason:
+                result[step] = {"users": stage["users"], "reason": reason}
+            previous[step] = s["throughput_per_sec"]
+    return result
+
+
+def print_stage(stage):
+    for step, s in stage["steps"].items():
+        lat = s["latency"] or {}
+        print(f"📈 users={stage['users']:<4} {step:<20} {s['throughput_per_sec']:8.2f}/s "
+              f"p50 {lat.get('p50_ms', 0):8.1f} ms  p90 {lat.get('p90_ms', 0):8.1f} ms  "
+              f"p99 {lat.get('p99_ms', 0):8.1f} ms  errors {s['error_rate']:.1%}")
+
+
+# ---------------------------------------------------------------------------
+# Stub LLM
+# ---------------------------------------------------------------------------
+
+def stub_llm_app(latency_ms):
+    async def reply(request):
+        await asyncio.sleep(latency_ms / 1000)
+        return random.choice(STUB_FEEDBACK)
+
+    async def letta_messages(request):
+        # ai_feedback.py reads the last assistant message
+        return web.json_response({"messages": [{"role": "assistant", "text": await reply(request)}]})
+
+    async def ai_feedback(request):
+        metrics = await request.json()
+        return web.json_response({"success": True, "feedback": await reply(request), "metrics": metrics, "using_ai": True})
+
+    app = web.Application()
+    app.router.add_post("/v1/agents/{agent_id}/messages", letta_messages)
+    app.router.add_post("/api/ai_feedback", ai_feedback)
+    return app
+
+
+async def start_stub_llm(port, latency_ms):
+    runner = web.AppRunner(stub_llm_app(latency_ms))
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    print(f"🤖 Stub LLM on http://localhost:{port} ({latency_ms:.0f} ms per reply)")
+    return runner
+
+
+async def main(args):
+    random.seed(SEED)
+    frames = FramePool(repeat=args.repeat_frames)
+    runner = await start_stub_llm(args.stub_llm, args.llm_latency_ms) if args.stub_llm else None
+    stages = []
+    try:
+        for level in args.users:
+            print(f"🚀 {level} user(s), flow={args.flow}, {args.duration:.0f}s")
+            stage = await run_stage(args, level, frames)
+            print_stage(stage)
+            stages.append(stage)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+    saturation = find_saturation(stages, args.slo_ms)
+    for step, s in saturation.items():
+        print(f"⚠️ {step} saturates at {s['users']} user(s): {s['reason']}")
+    if not saturation:
+        print(f"✅ No step saturated up to {args.users[-1]} user(s)")
+    return {"flow": args.flow, "interval": args.interval, "stages": stages, "saturation": saturation}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test of the posture services")
+    parser.add_argument("--flow", choices=FLOWS, default="analyze")
+    parser.add_argument("--users", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16],
+                        help="Concurrent users; a comma list runs one stage per level")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per stage")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between a user's captures")
+    parser.add_argument("--arrival-rate", type=float, default=2.0, help="New users per second (0: all at once)")
+    parser.add_argument("--subscribers", type=int, default=0, help="Dashboard Socket.IO clients")
+    parser.add_argument("--feedback", choices=FEEDBACK_MODES, default="bad")
+    parser.add_argument("--no-store", action="store_true", help="analyze: don't keep frames on disk")
+    parser.add_argument("--repeat-frames", action="store_true",
+                        help="Cycle %d identical frames (result cache hits) instead of unique ones" % FRAME_POOL_SIZE)
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p90 latency budget per step")
+    parser.add_argument("--stub-llm", type=int, metavar="PORT", help="Serve a stub LLM on this port")
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--metrics-url", default=METRICS_URL)
+    parser.add_argument("--dashboard-url", default=DASHBOARD_URL)
+    parser.add_argument("--feedback-url", default=FEEDBACK_URL)
+    parser.add_argument("--upload-url", default=UPLOAD_URL)
+    parser.add_argument("--stream-url", default=STREAM_URL)
+    parser.add_argument("--out", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Results written to {args.out}")
@@ -0,0 +1,83 @@
+"""
+Append-only store of full metric dicts, one JSON Lines file per session.
+
+Rows look like:
+
+    {"session": ..., "index": 12, "frame": "frame_000013.jpg",
+     "captured_at": "2025-10-26T00:05:42", "metrics": {...}}
+
+Writers append a whole batch with a single write. Readers stream rows one at
+a time, so neither side holds a session in memory. Lives next to the sessions
+in storage/metrics/.
+"""
+
+import json
+import os
+from pathlib import Path
+
+from storage_lifecycle import SESSIONS_DIR
+
+METRICS_DIR = SESSIONS_DIR.parent / "metrics"
+
+
+def _default(value):
+    # numpy scalars that aren't float/int subclasses
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_row(row):
+    return json.dumps(row, separators=(",", ":"), default=_default) + "\n"
+
+
+class MetricsStore:
+    def __init__(self, root=None):
+        self.root = Path(root) if root else METRICS_DIR
+
+    def path(self, session):
+        return self.root / f"{session}.jsonl"
+
+    def append_batch(self, session, rows):
+        """Append `rows` in one write; returns the file size afterwards."""
+        if not rows:
+            return self.size(session)
+        self.root.mkdir(parents=True, exist_ok=True)
+        data = "".join(encode_row(r) for r in rows).encode("utf-8")
+        with open(self.path(session), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def size(self, session):
+        try:
+            return self.path(session).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def truncate(self, session, size):
+        """Drop anything written after `size` bytes (rows a checkpoint never covered)."""
+        path = self.path(session)
+        if path.exists() and path.stat().st_size > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def remove(self, session):
+        self.path(session).unlink(missing_ok=True)
+
+    def sessions(self):
+        if not self.root.is_dir():
+            return []
+        return sorted(p.stem for p in self.root.glob("*.jsonl"))
+
+    def iter_rows(self, session=None):
+        """Stream rows for one session, or for every session."""
+        for name in ([session] if session else self.sessions()):
+            path = self.path(name)
+            if not path.exists():
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
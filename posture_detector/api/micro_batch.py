@@ -0,0 +1,153 @@
+"""
+Micro-batching for model calls that arrive together.
+
+Callers block in MicroBatcher.submit(item). The first caller in an empty queue
+becomes the batch leader and tries to take one of `slots` (a semaphore shared
+with any other model calls). If one is free it starts at once, so an idle
+service adds no latency. Otherwise the batch stays open, collecting requests
+that arrive meanwhile, until a slot frees, `max_batch` items are queued or
+`window_ms` passes; then the leader waits for its slot with whatever it has.
+The leader calls `run_batch(items)` while holding the slot; it must return one
+result per item in order. Any items beyond `max_batch` stay queued and the
+oldest becomes the next leader, so several batches can run in parallel, one
+per slot.
+"""
+
+import threading
+import time
+
+SLOT_POLL_SECONDS = 0.002  # slots freed outside the batcher don't notify its condition
+
+
+class Slots:
+    """BoundedSemaphore that also counts the threads blocked waiting for it."""
+
+    def __init__(self, count):
+        self._sem = threading.BoundedSemaphore(count)
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    def acquire(self, blocking=True):
+        if self._sem.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        with self._lock:
+            self.waiting += 1
+        try:
+            return self._sem.acquire()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self):
+        self._sem.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class _Pending:
+    __slots__ = ("item", "lead", "done", "result", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.lead = False
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, window_ms=250, max_batch=4, slots=None):
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.slots = slots if slots is not None else Slots(1)
+        self._queue = []
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    def submit(self, item):
+        if self.window_ms <= 0 or self.max_batch <= 1:
+            with self.slots:
+                return self._run([_Pending(item)])
+        req = _Pending(item)
+        with self._cond:
+            self._queue.append(req)
+            if len(self._queue) == 1:
+                req.lead = True
+            self._cond.notify_all()
+            while not (req.lead or req.done):
+                self._cond.wait()
+            if req.done:
+                if req.error is not None:
+                    raise req.error
+                return req.result
+
+            # Leader: hold the batch open only while every slot is busy anyway
+            slot = self.slots.acquire(blocking=False)
+            deadline = time.monotonic() + self.window_ms / 1000
+            while not slot and len(self._queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(min(remaining, SLOT_POLL_SECONDS))
+                slot = self.slots.acquire(blocking=False)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            if self._queue:
+                self._queue[0].lead = True
+                self._cond.notify_all()
+        if not slot:
+            self.slots.acquire()
+        try:
+            return self._run(batch, req)
+        finally:
+            self.slots.release()
+
+    def _run(self, batch, own=None):
+        """Run `batch` (the caller holds a slot) and hand each waiter its result."""
+        try:
+            results = self.run_batch([r.item for r in batch])
+            error = None
+        except Exception as e:
+            results = [None] * len(batch)
+            error = e
+        with self._cond:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            for r, result in zip(batch, results):
+                r.result = result
+                r.error = error
+                r.done = True
+            self._cond.notify_all()
+        own = own or batch[0]
+        if own.error is not None:
+            raise own.error
+        return own.result
+
+    def queued(self):
+        """Requests not yet taken into a batch."""
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "window_ms": self.window_ms,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "items": self.items,
+                "largest_batch": self.largest,
+                "mean_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "queued": len(self._queue),
+            }
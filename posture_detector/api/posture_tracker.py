@@ -0,0 +1,135 @@
+"""
+Per-session temporal smoothing of posture metrics.
+
+Single-frame masks are noisy, so scoring every frame on its own makes
+`posture` flip between 0 and 1. A PostureTracker keeps an EMA of each metric
+and applies hysteresis to the posture decision. The decision only changes
+after SWITCH_FRAMES consecutive frames disagree with the current state.
+It also remembers the last fitted plane per region (chest/neck/face). A frame
+whose mask is too small to fit reuses the previous plane instead of producing
+garbage angles, and the robust fitter starts from it.
+
+Frames below the confidence gate go through hold() instead of update(): they
+are reported against the current decision but never smoothed in, and their
+plane fits are dropped.
+"""
+
+import math
+import threading
+import time
+
+EMA_ALPHA = 0.4          # weight of the newest frame
+SWITCH_FRAMES = 2        # consecutive disagreeing frames before posture flips
+MIN_PLANE_PIXELS = 50    # below this a region's plane is carried over
+SESSION_TTL_SECONDS = 3600
+
+SMOOTHED_METRICS = (
+    "chest_roll", "chest_pitch",
+    "neck_roll", "neck_pitch",
+    "face_roll", "face_pitch",
+    "face_dist", "chest_dist",
+    "neck_area",
+    "eye_strain", "neck_strain",
+)
+
+
+class PostureTracker:
+    def __init__(self, alpha=EMA_ALPHA, switch_frames=SWITCH_FRAMES):
+        self.alpha = alpha
+        self.switch_frames = switch_frames
+        self.state = {}
+        self.planes = {}
+        self.pending_planes = {}  # this frame's fits; kept by update(), dropped by hold()
+        self.posture = None
+        self.disagree = 0
+        self.stable = 0          # consecutive frames whose raw posture matched the smoothed one
+        self.frames = 0
+        self.last_seen = time.time()
+        self.cascade = None      # cascade.CascadeState, when the session uses the cascade
+        self.lock = threading.Lock()
+
+    def previous_plane(self, region):
+        plane = self.planes.get(region)
+        return plane[:2] if plane else None
+
+    def previous_normal(self, region):
+        plane = self.planes.get(region)
+        return plane[2] if plane else None
+
+    def record_plane(self, region, roll, pitch, normal=None):
+        self.pending_planes[region] = (roll, pitch, normal)
+
+    def hold(self, metric_dict):
+        """
+        Report a frame without learning from it (low confidence).
+
+        The EMA, hysteresis and stability count are untouched; `posture` is the
+        session's current decision and `raw_posture` this frame's own verdict.
+        """
+        raw = int(metric_dict["posture"])
+        metric_dict["raw_posture"] = raw
+        metric_dict["posture"] = raw if self.posture is None else self.posture
+        metric_dict["posture_changed"] = False
+        self.pending_planes = {}
+        return metric_dict
+
+    def update(self, metric_dict, is_correct):
+        """
+        Smooth `metric_dict` in place and apply hysteresis to its posture.
+
+        Adds `raw_posture` (this frame alone) and `posture_changed`.
+        """
+        self.frames += 1
+        self.last_seen = time.time()
+        self.planes.update(self.pending_planes)
+        self.pending_planes = {}
+        for name in SMOOTHED_METRICS:
+            value = float(metric_dict[name])
+            prev = self.state.get(name)
+            if not math.isfinite(value):
+                # One bad frame must not poison the EMA for the rest of the session
+                if prev is None:
+                    continue
+                value = prev
+            self.state[name] = value if prev is None else self.alpha * value + (1 - self.alpha) * prev
+            metric_dict[name] = self.state[name]
+        metric_dict["depth_diff"] = metric_dict["chest_dist"] - metric_dict["face_dist"]
+
+        raw = int(metric_dict["posture"])
+        candidate = int(is_correct(metric_dict))
+        previous = self.posture
+        if self.posture is None:
+            self.posture = candidate
+        elif candidate != self.posture:
+            self.disagree += 1
+            if self.disagree >= self.switch_frames:
+                self.posture = candidate
+                self.disagree = 0
+        else:
+            self.disagree = 0
+
+        metric_dict["raw_posture"] = raw
+        metric_dict["posture"] = self.posture
+        metric_dict["posture_changed"] = previous is None or previous != self.posture
+        self.stable = self.stable + 1 if raw == self.posture and not metric_dict["posture_changed"] else 0
+        return metric_dict
+
+
+_lock = threading.Lock()
+_trackers = {}
+
+
+def get_tracker(session_id):
+    now = time.time()
+    with _lock:
+        for sid in [s for s, t in _trackers.items() if now - t.last_seen > SESSION_TTL_SECONDS]:
+            del _trackers[sid]
+        tracker = _trackers.get(session_id)
+        if tracker is None:
+            tracker = _trackers[session_id] = PostureTracker()
+        return tracker
+
+
+def reset_tracker(session_id):
+    with _lock:
+        _trackers.pop(session_id, None)
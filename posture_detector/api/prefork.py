@@ -0,0 +1,120 @@
+"""
+Prefork server for the metrics service.
+
+The parent loads the models once, on the CPU, binds the listening socket and
+forks N workers. Model weights are only read after the fork, so the workers
+share the parent's pages copy-on-write instead of each holding its own copy.
+Every worker accepts on the same socket and gets an equal slice of the CPU
+cores for torch. Anything that is not fork-safe (GPU placement, inference such
+as autotuning) belongs in `post_fork`, which each worker runs before serving.
+"""
+
+import gc
+import os
+import signal
+import socket
+import time
+
+from werkzeug.serving import make_server
+
+
+def threads_per_worker(workers, cpu_count=None):
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // max(1, workers))
+
+
+def _pin_torch_threads(num_threads):
+    # Must run in the child before its first inference call
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set (interop pool started); intra-op pinning still applies
+        pass
+
+
+def _run_worker(app, sock, num_threads, post_fork=None):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    _pin_torch_threads(num_threads)
+    if post_fork is not None:
+        post_fork()
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=False, fd=sock.fileno())
+    print(f"✓ Worker {os.getpid()} serving with {num_threads} torch thread(s)")
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def _spawn(app, sock, num_threads, post_fork=None):
+    pid = os.fork()
+    if pid == 0:
+        _run_worker(app, sock, num_threads, post_fork)
+    return pid
+
+
+def serve_prefork(app, host, port, workers, preload=None, torch_threads=None, post_fork=None):
+    """
+    Serve `app` from `workers` forked processes sharing one listening socket.
+
+    Args:
+        app: WSGI application
+        host, port: address to bind
+        workers: number of worker processes
+        preload: callable run once in the parent before forking (model loading, CPU only)
+        torch_threads: intra-op threads per worker (default: cores // workers)
+        post_fork: callable run in each worker after thread pinning, before serving
+    """
+    num_threads = torch_threads or threads_per_worker(workers)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    if preload is not None:
+        start = time.perf_counter()
+        preload()
+        print(f"✓ Preloaded in parent in {time.perf_counter() - start:.1f}s")
+
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers don't touch (and un-share) the preloaded objects' pages.
+    gc.collect()
+    gc.freeze()
+
+    children = {_spawn(app, sock, num_threads, post_fork) for _ in range(workers)}
+    print(f"✅ Prefork server on http://{host}:{port} with {workers} workers x {num_threads} torch thread(s)")
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"[WARN] Worker {pid} exited with status {status}, respawning")
+            children.add(_spawn(app, sock, num_threads, post_fork))
+
+    sock.close()
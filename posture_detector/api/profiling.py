@@ -0,0 +1,446 @@
+"""
+On-demand profiling for the Flask services, without a restart.
+
+Every service calls register_profiling(app). Set ADMIN_TOKEN to enable the
+endpoints; without it they answer 404.
+
+    curl -X POST -H "Authorization: Bearer $ADMIN_TOKEN" \
+         "localhost:5500/admin/profile?mode=sample&seconds=20&torch=1"
+    curl -H "Authorization: Bearer $ADMIN_TOKEN" localhost:5500/admin/profile/<id>/collapsed > out.folded
+    flamegraph.pl out.folded > flame.svg          # or load out.folded in speedscope
+    curl -H "Authorization: Bearer $ADMIN_TOKEN" localhost:5500/admin/profile/<id>/torch > trace.json
+
+Modes:
+    sample    a background OS thread records every thread's stack each
+              interval_ms (default 5). Cheap enough for production.
+    cprofile  deterministic cProfile of whole requests, one request at a time.
+              Requests that overlap a profiled one are counted as skipped.
+              Call stacks are rebuilt from the caller graph, so their
+              weights are approximate.
+
+A session ends after `seconds` (default 10, at most MAX_PROFILE_SECONDS) or
+after `requests` completed requests, whichever comes first. DELETE
+/admin/profile stops it early. With torch=1, the first TORCH_TRACE_LIMIT
+inference stages (get_depth's spans) are also captured with
+torch.profiler as one Chrome trace.
+
+Profiles are per process: in prefork mode you get the worker that served
+the admin request.
+"""
+
+import cProfile
+import hmac
+import importlib
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from functools import wraps
+
+from flask import Response, g, jsonify, request
+
+import stage_timing
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+DEFAULT_PROFILE_SECONDS = 10
+MAX_PROFILE_SECONDS = 300
+DEFAULT_INTERVAL_MS = 5
+TORCH_TRACE_LIMIT = 20
+TORCH_STAGES = ("depth_inference", "segmentation_inference", "upsample_argmax")
+KEEP_PROFILES = 5
+MAX_STACK_DEPTH = 128
+MODES = ("sample", "cprofile")
+# Innermost Python function of a thread that is only waiting; left out unless idle=1
+IDLE_FUNCTIONS = {"wait", "select", "poll", "do_poll", "accept", "sleep", "_wait_for_tstate_lock", "acquire", "get", "readinto"}
+
+
+def _original(name):
+    # app.py runs under eventlet.monkey_patch(); the sampler must be a real OS
+    # thread that really sleeps, not a green thread waiting for the hub
+    eventlet = sys.modules.get("eventlet")
+    if eventlet is not None:
+        return eventlet.patcher.original(name)
+    return importlib.import_module(name)
+
+
+_threading = _original("threading")
+_time = _original("time")
+
+_lock = _threading.Lock()
+_cprofile_lock = _threading.Lock()
+_torch_lock = _threading.Lock()
+_active = None
+_recent = deque(maxlen=KEEP_PROFILES)
+_counter = 0
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_frame(frame):
+    """Root-to-leaf `a;b;c` for a Python frame."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def cprofile_to_collapsed(stats):
+    """
+    Collapsed stacks (microseconds) from pstats data.
+
+    cProfile keeps caller -> callee edges, not stacks. Each function's own
+    time is split across the paths that reach it, in proportion to the
+    cumulative time of each edge.
+    """
+    entries = stats.stats
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    def name(func):
+        filename, line, fn = func
+        return f"{fn} ({os.path.basename(filename)}:{line})"
+
+    out = Counter()
+
+    def walk(func, path, seen, scale):
+        _, _, tt, ct, _ = entries[func]
+        stack = f"{path};{name(func)}" if path else name(func)
+        if tt * scale > 0:
+            out[stack] += tt * scale
+        if len(seen) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_ct in children.get(func, ()):
+            child_ct = entries[child][3]
+            if child in seen or child_ct <= 0 or edge_ct <= 0:
+                continue
+            walk(child, stack, seen | {child}, scale * edge_ct / child_ct)
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            walk(func, "", {func}, 1.0)
+    return Counter({stack: round(seconds * 1e6) for stack, seconds in out.items() if seconds * 1e6 >= 1})
+
+
+class ProfileSession:
+    def __init__(self, mode, seconds, requests, interval_ms, torch_trace, idle):
+        global _counter
+        _counter += 1
+        self.id = f"{int(time.time())}-{_counter}"
+        self.mode = mode
+        self.seconds = seconds
+        self.max_requests = requests
+        self.interval = interval_ms / 1000
+        self.torch_trace = torch_trace
+        self.idle = idle
+        self.started = time.time()
+        self.deadline = _time.monotonic() + seconds
+        self.finished = None
+        self.stopped_by = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.requests = 0
+        self.skipped = 0
+        self.stats = None
+        self.trace_events = []
+        self.traces = 0
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "state": "running" if self.running else "done",
+            "stopped_by": self.stopped_by,
+            "started": self.started,
+            "seconds": round((self.finished or time.time()) - self.started, 3),
+            "limit_seconds": self.seconds,
+            "limit_requests": self.max_requests,
+            "requests": self.requests,
+            "skipped_requests": self.skipped,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "unit": "samples" if self.mode == "sample" else "microseconds",
+            "torch_traces": self.traces,
+            "pid": os.getpid(),
+        }
+
+    def finish(self, reason):
+        global _active
+        with _lock:
+            if not self.running:
+                return
+            self.finished = time.time()
+            self.stopped_by = reason
+            if _active is self:
+                _active = None
+            _recent.append(self)
+        if self.stats is not None:
+            self.stacks.update(cprofile_to_collapsed(self.stats))
+
+    def sample(self, own_ident):
+        names = {t.ident: t.name for t in _threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not self.idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            self.stacks[f"{names.get(ident, f'thread-{ident}')};{collapse_frame(frame)}"] += 1
+        self.samples += 1
+
+    def run(self):
+        """Sampler/timer loop, on its own OS thread."""
+        own = _threading.get_ident()
+        while self.running:
+            if self.mode == "sample":
+                self.sample(own)
+            if _time.monotonic() >= self.deadline:
+                self.finish("time")
+                return
+            _time.sleep(self.interval if self.mode == "sample" else 0.05)
+
+    # -- request hooks --------------------------------------------------
+
+    def request_started(self):
+        if self.mode != "cprofile":
+            return
+        if not _cprofile_lock.acquire(blocking=False):
+            # cProfile can't profile two threads at once (3.12+ refuses outright)
+            self.skipped += 1
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        g._profiler = profiler
+
+    def request_finished(self):
+        profiler = g.pop("_profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            _cprofile_lock.release()
+            with _lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+        elif self.mode == "cprofile":
+            return
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self.finish("requests")
+
+    # -- torch ----------------------------------------------------------
+
+    def add_trace(self, events):
+        with _lock:
+            self.trace_events.extend(events)
+            self.traces += 1
+
+
+class _TorchStage:
+    """Runs one inference stage under torch.profiler and hands the trace to the session."""
+
+    def __init__(self, session, stage, torch):
+        self.session = session
+        self.stage = stage
+        self.torch = torch
+        self.profile = None
+        self.label = None
+
+    def __enter__(self):
+        # _stage_wrapper took _torch_lock for us; hand it back if the profiler can't start
+        tp = self.torch.profiler
+        try:
+            profile = tp.profile(activities=[tp.ProfilerActivity.CPU], record_shapes=True)
+            profile.__enter__()
+            try:
+                label = tp.record_function(self.stage)
+                label.__enter__()
+            except BaseException:
+                profile.__exit__(None, None, None)
+                raise
+        except BaseException as e:
+            _torch_lock.release()
+            if not isinstance(e, Exception):
+                raise
+            print(f"⚠️ torch profiler failed to start for {self.stage}, running it unprofiled: {e}")
+            return self
+        self.profile, self.label = profile, label
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is None:
+            # Never started (see __enter__); the lock is already released
+            return False
+        try:
+            self.label.__exit__(*exc)
+            self.profile.__exit__(*exc)
+            fd, path = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            try:
+                self.profile.export_chrome_trace(path)
+                with open(path, encoding="utf-8") as f:
+                    self.session.add_trace(json.load(f).get("traceEvents", []))
+            finally:
+                os.unlink(path)
+        finally:
+            _torch_lock.release()
+        return False
+
+
+def _stage_wrapper(stage):
+    session = _active
+    if session is None or not session.torch_trace or stage not in TORCH_STAGES:
+        return None
+    torch = sys.modules.get("torch")
+    if torch is None or session.traces >= TORCH_TRACE_LIMIT:
+        return None
+    # One torch profiler at a time; concurrent stages just run unprofiled
+    if not _torch_lock.acquire(blocking=False):
+        return None
+    return _TorchStage(session, stage, torch)
+
+
+def start_profile(mode="sample", seconds=None, requests=None, interval_ms=DEFAULT_INTERVAL_MS,
+                  torch_trace=False, idle=False):
+    global _active
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if seconds is None:
+        seconds = MAX_PROFILE_SECONDS if requests else DEFAULT_PROFILE_SECONDS
+    seconds = min(max(float(seconds), 0.1), MAX_PROFILE_SECONDS)
+    with _lock:
+        if _active is not None:
+            return None
+        session = _active = ProfileSession(mode, seconds, requests, max(float(interval_ms), 1.0), torch_trace, idle)
+    stage_timing.set_stage_wrapper(_stage_wrapper if torch_trace else None)
+    _threading.Thread(target=session.run, name="profiler", daemon=True).start()
+    return session
+
+
+def find_session(profile_id):
+    with _lock:
+        for session in [_active, *_recent]:
+            if session is not None and session.id == profile_id:
+                return session
+    return None
+
+
+def _authorized():
+    supplied = request.headers.get("X-Admin-Token", "")
+    auth = request.headers.get("Authorization", "")
+    if auth.startswith("Bearer "):
+        supplied = auth[len("Bearer "):].strip()
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def admin_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        if not _authorized():
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def register_profiling(app):
+    """Add /admin/profile routes and the per-request hooks to a Flask app."""
+
+    @app.before_request
+    def _profile_request_started():
+        session = _active
+        if session is not None and not request.path.startswith("/admin/"):
+            g._profile_session = session
+            session.request_started()
+
+    @app.teardown_request
+    def _profile_request_finished(exc=None):
+        session = g.pop("_profile_session", None)
+        if session is not None:
+            session.request_finished()
+
+    @app.route("/admin/profile", methods=["GET", "POST", "DELETE"], endpoint="admin_profile")
+    @admin_only
+    def admin_profile():
+        if request.method == "GET":
+            with _lock:
+                active = _active.summary() if _active is not None else None
+                recent = [s.summary() for s in reversed(_recent)]
+            return jsonify({"active": active, "recent": recent})
+        if request.method == "DELETE":
+            session = _active
+            if session is None:
+                return jsonify({"error": "No profile running"}), 404
+            session.finish("stopped")
+            return jsonify(session.summary())
+        params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+        try:
+            session = start_profile(
+                mode=params.get("mode", "sample"),
+                seconds=params.get("seconds"),
+                requests=int(params["requests"]) if params.get("requests") else None,
+                interval_ms=params.get("interval_ms", DEFAULT_INTERVAL_MS),
+                torch_trace=str(params.get("torch", "0")).lower() in ("1", "true"),
+                idle=str(params.get("idle", "0")).lower() in ("1", "true"),
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if session is None:
+            return jsonify({"error": "A profile is already running", "active": _active.summary() if _active else None}), 409
+        return jsonify(session.summary()), 202
+
+    @app.route("/admin/profile/<profile_id>", methods=["GET"], endpoint="admin_profile_status")
+    @admin_only
+    def admin_profile_status(profile_id):
+        session = find_session(profile_id)
+        if session is None:
+            return jsonify({"error": "Unknown profile"}), 404
+        return jsonify(session.summary())
+
+    @app.route("/admin/profile/<profile_id>/collapsed", methods=["GET"], endpoint="admin_profile_collapsed")
+    @admin_only
+    def admin_profile_collapsed(profile_id):
+        session = find_session(profile_id)
+        if session is None:
+            return jsonify({"error": "Unknown profile"}), 404
+        if session.running:
+            return jsonify({"error": "Profile still running", **session.summary()}), 409
+        body = "".join(f"{stack} {count}\n" for stack, count in session.stacks.most_common())
+        return Response(body, mimetype="text/plain")
+
+    @app.route("/admin/profile/<profile_id>/pstats", methods=["GET"], endpoint="admin_profile_pstats")
+    @admin_only
+    def admin_profile_pstats(profile_id):
+        session = find_session(profile_id)
+        if session is None or session.stats is None:
+            return jsonify({"error": "No cProfile data for this profile"}), 404
+        out = io.StringIO()
+        stats = pstats.Stats(stream=out)
+        stats.add(session.stats)
+        stats.sort_stats(request.args.get("sort", "cumulative")).print_stats(int(request.args.get("limit", 60)))
+        return Response(out.getvalue(), mimetype="text/plain")
+
+    @app.route("/admin/profile/<profile_id>/torch", methods=["GET"], endpoint="admin_profile_torch")
+    @admin_only
+    def admin_profile_torch(profile_id):
+        session = find_session(profile_id)
+        if session is None or not session.traces:
+            return jsonify({"error": "No torch trace for this profile"}), 404
+        with _lock:
+            events = list(session.trace_events)
+        # Chrome trace format: open in chrome://tracing or https://ui.perfetto.dev
+        return jsonify({"traceEvents": events, "displayTimeUnit": "ms"})
+
+    return app
@@ -0,0 +1,280 @@
+"""
+Recompute metrics for stored sessions, e.g. after changing thresholds or models.
+
+    python replay.py                          # every session, all cores
+    python replay.py --sessions abc def --workers 4
+    python replay.py --stand-in               # offline stand-in models (testing)
+
+The session tree (storage/sessions/*/frames plus archived frames.zip) is
+walked lazily in frame order. Chunks of frames fan out to a process pool, and
+only a bounded number of chunks is in flight at a time. Each worker loads the
+models once, pins its torch threads to its share of the cores and scores
+frames independently.
+
+The parent puts results back in frame order per session and applies that
+session's EMA/hysteresis smoothing exactly as the live service does. It then
+appends rows to the MetricsStore in batches. After every batch a checkpoint
+records how far each session got, with its tracker state, so an interrupted
+run resumes where it stopped (--restart starts over). Frames are scored
+independently, so a tiny mask can't borrow the previous frame's plane here.
+"""
+
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from metrics_store import MetricsStore
+from storage_lifecycle import ARCHIVE_NAME, SESSIONS_DIR
+
+CHUNK_FRAMES = 8
+BATCH_ROWS = 256
+INFLIGHT_PER_WORKER = 4
+CHECKPOINT_NAME = "replay_checkpoint.json"
+FRAME_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+# ---------------------------------------------------------------------------
+# Walking the session tree
+# ---------------------------------------------------------------------------
+
+def iter_session_frames(session_dir):
+    """Yield (index, name, source) in frame-name order; source is a path or (zip, member)."""
+    sources = {}
+    archive = session_dir / ARCHIVE_NAME
+    if archive.exists():
+        with zipfile.ZipFile(archive) as zf:
+            for name in zf.namelist():
+                if name.lower().endswith(FRAME_SUFFIXES):
+                    sources[name] = (str(archive), name)
+    frames_dir = session_dir / "frames"
+    if frames_dir.is_dir():
+        for entry in os.scandir(frames_dir):
+            if entry.is_file() and entry.name.lower().endswith(FRAME_SUFFIXES):
+                sources[entry.name] = entry.path
+    for index, name in enumerate(sorted(sources)):
+        yield index, name, sources[name]
+
+
+def iter_chunks(sessions, skip):
+    """Yield (session, [(index, name, source), ...]) chunks, skipping checkpointed frames."""
+    for session in sessions:
+        chunk = []
+        for index, name, source in iter_session_frames(SESSIONS_DIR / session):
+            if index < skip.get(session, 0):
+                continue
+            chunk.append((index, name, source))
+            if len(chunk) == CHUNK_FRAMES:
+                yield session, chunk
+                chunk = []
+        if chunk:
+            yield session, chunk
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _init_worker(threads, stand_in):
+    from prefork import _pin_torch_threads
+    _pin_torch_threads(threads)
+    if stand_in:
+        from benchmark import install_stand_in_models
+        install_stand_in_models()
+    else:
+        from get_depth import warm_up
+        warm_up(background=False)
+
+
+def _read_frame(source):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(), datetime.fromtimestamp(os.path.getmtime(source))
+    archive, member = source
+    with zipfile.ZipFile(archive) as zf:
+        return zf.read(member), datetime(*zf.getinfo(member).date_time)
+
+
+def process_chunk(session, frames):
+    """Score each frame on its own; returns [(index, name, captured_at, metrics, error)]."""
+    from calibration import get_calibration
+    from frame_cache import decode_frame_bytes
+    from get_metrics import compute_metrics
+
+    calibration = get_calibration(session)
+    # Only apply a finished baseline; replay must not feed the live calibration
+    calibration = calibration if calibration.complete else None
+    results = []
+    for index, name, source in frames:
+        try:
+            data, captured_at = _read_frame(source)
+            frame = decode_frame_bytes(data, f"{session}/{name}")
+            metrics = compute_metrics(index, frame, save_artifacts=False, calibration=calibration)
+            results.append((index, name, captured_at.isoformat(timespec="seconds"), metrics, None))
+        except Exception as e:
+            results.append((index, name, None, None, str(e)))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Parent side: ordering, smoothing, bulk writes, checkpoints
+# ---------------------------------------------------------------------------
+
+def tracker_snapshot(tracker):
+    return {"state": tracker.state, "posture": tracker.posture, "disagree": tracker.disagree, "frames": tracker.frames}
+
+
+def restore_tracker(snapshot):
+    from posture_tracker import PostureTracker
+    tracker = PostureTracker()
+    if snapshot:
+        tracker.state = dict(snapshot["state"])
+        tracker.posture = snapshot["posture"]
+        tracker.disagree = snapshot["disagree"]
+        tracker.frames = snapshot["frames"]
+    return tracker
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.sessions = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                self.sessions = json.load(f).get("sessions", {})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sessions": self.sessions, "updated": datetime.now().isoformat(timespec="seconds")}, f)
+        os.replace(tmp, self.path)
+
+
+class SessionWriter:
+    """Reorders one session's results, smooths them and writes them in batches."""
+
+    def __init__(self, session, store, checkpoint, is_correct, min_confidence=0.0):
+        self.session = session
+        self.store = store
+        self.checkpoint = checkpoint
+        self.is_correct = is_correct
+        self.min_confidence = min_confidence
+        entry = checkpoint.sessions.get(session, {})
+        self.next_index = entry.get("next_index", 0)
+        self.tracker = restore_tracker(entry.get("tracker"))
+        self.pending = {}
+        self.rows = []
+        # Rows past the last checkpoint may be a partial batch from a crash
+        store.truncate(session, entry.get("offset", 0))
+
+    def add(self, results):
+        for result in results:
+            self.pending[result[0]] = result
+        while self.next_index in self.pending:
+            index, name, captured_at, metrics, error = self.pending.pop(self.next_index)
+            row = {"session": self.session, "index": index, "frame": name, "captured_at": captured_at}
+            if error is None and metrics["confidence"] < self.min_confidence:
+                # Same gate as the live service: reported, never smoothed in
+                row["metrics"] = self.tracker.hold(metrics)
+            elif error is None:
+                row["metrics"] = self.tracker.update(metrics, self.is_correct)
+            else:
+                row["error"] = error
+            self.rows.append(row)
+            self.next_index += 1
+        if len(self.rows) >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self, done=False):
+        offset = self.store.append_batch(self.session, self.rows)
+        self.rows = []
+        self.checkpoint.sessions[self.session] = {
+            "next_index": self.next_index,
+            "offset": offset,
+            "tracker": tracker_snapshot(self.tracker),
+            "done": done,
+        }
+        self.checkpoint.save()
+
+
+def replay(sessions=None, workers=None, stand_in=False, restart=False, store=None):
+    from get_metrics import CONFIDENCE_THRESHOLD, is_correct
+    from prefork import threads_per_worker
+
+    store = store or MetricsStore()
+    checkpoint = Checkpoint(store.root / CHECKPOINT_NAME)
+    if sessions is None:
+        sessions = sorted(p.name for p in SESSIONS_DIR.iterdir() if p.is_dir()) if SESSIONS_DIR.is_dir() else []
+    if restart:
+        for session in sessions:
+            checkpoint.sessions.pop(session, None)
+            store.remove(session)
+    todo = [s for s in sessions if not checkpoint.sessions.get(s, {}).get("done")]
+    skip = {s: checkpoint.sessions.get(s, {}).get("next_index", 0) for s in todo}
+
+    workers = workers or os.cpu_count() or 1
+    threads = threads_per_worker(workers)
+    writers = {}
+    frames = errors = 0
+    started = time.perf_counter()
+    print(f"🔁 Replaying {len(todo)} session(s) with {workers} worker(s) x {threads} thread(s)")
+
+    chunks = iter_chunks(todo, skip)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads, stand_in)) as pool:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the pool busy without materialising the whole tree
+            while not exhausted and len(pending) < workers * INFLIGHT_PER_WORKER:
+                try:
+                    session, chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(process_chunk, session, chunk)] = session
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                session = pending.pop(future)
+                results = future.result()
+                writer = writers.get(session)
+                if writer is None:
+                    writer = writers[session] = SessionWriter(session, store, checkpoint, is_correct, CONFIDENCE_THRESHOLD)
+                writer.add(results)
+                frames += len(results)
+                errors += sum(1 for r in results if r[4] is not None)
+            elapsed = time.perf_counter() - started
+            print(f"   {frames} frames, {frames / elapsed:.1f} frames/s", end="\r")
+
+    for writer in writers.values():
+        writer.flush(done=True)
+    elapsed = time.perf_counter() - started
+    summary = {
+        "sessions": len(todo),
+        "frames": frames,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "frames_per_sec": round(frames / elapsed, 2) if elapsed else None,
+        "store": str(store.root),
+    }
+    print(f"\n✅ Replay finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute metrics for stored sessions")
+    parser.add_argument("--sessions", nargs="*", help="Session ids (default: all under storage/sessions)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--out", default=None, help="Metrics store directory (default: storage/metrics)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and recompute from scratch")
+    parser.add_argument("--stand-in", action="store_true", help="Use the offline stand-in models")
+    args = parser.parse_args()
+
+    replay(args.sessions, args.workers, args.stand_in, args.restart, MetricsStore(args.out) if args.out else None)
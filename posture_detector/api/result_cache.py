@@ -0,0 +1,202 @@
+"""
+Content-addressed cache of model outputs (depth map + face-parsing masks).
+
+Entries are keyed by sha256(frame bytes) plus the model/version config, so a
+re-request for a frame that hasn't changed skips inference entirely, whatever
+`id` it arrives with. Lookups go memory LRU -> disk store -> compute. The disk
+store lives in its own directory (../storage/results, not ../face, whose
+intermediate artifacts storage_lifecycle sweeps) under content-addressed names
+({key}_depth.png, {key}_{label}_feature.png) written atomically, so repeat
+or concurrent requests never collide on a shared `{id}_*.png` file. Misses are
+written by a background thread, off the request path, and the store keeps at
+most RESULT_STORE_MAX_ENTRIES frames, evicting the least recently used.
+Concurrent misses for the same key wait for the first computation.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from stage_timing import span
+
+# Bump when the pipeline changes in a way that alters depth maps or masks
+CACHE_VERSION = "1"
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "16"))
+STORE_DIR = os.environ.get("RESULT_STORE_DIR", "../storage/results")
+RESULT_STORE_MAX_ENTRIES = int(os.environ.get("RESULT_STORE_MAX_ENTRIES", "512"))
+PRUNE_EVERY = 32         # stores between eviction scans of STORE_DIR
+STORE_QUEUE_SIZE = 64    # pending writes; past this, misses are not persisted
+FEATURES = (1, 2, 18)
+
+
+def config_fingerprint():
+    import get_depth
+    fingerprint = f"{CACHE_VERSION}|{get_depth.DEPTH_MODEL_ID}|{get_depth.FACE_PARSING_MODEL_ID}|{','.join(map(str, FEATURES))}"
+    # Native input size keeps the historical key; other sizes give different outputs
+    if get_depth.INPUT_SCALE != 1.0:
+        fingerprint += f"|scale={get_depth.INPUT_SCALE}"
+    return fingerprint
+
+
+def cache_key(digest):
+    return hashlib.sha256(f"{digest}|{config_fingerprint()}".encode()).hexdigest()[:32]
+
+
+def _paths(key):
+    paths = {"depth": os.path.join(STORE_DIR, f"{key}_depth.png")}
+    for feature in FEATURES:
+        paths[feature] = os.path.join(STORE_DIR, f"{key}_{feature}_feature.png")
+    return paths
+
+
+def _write_atomic(array, path):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    Image.fromarray(array, "L").save(tmp, "PNG")
+    os.replace(tmp, path)
+
+
+def prune_store(max_entries=None):
+    """Delete the least recently used frames beyond `max_entries`; returns how many went."""
+    max_entries = RESULT_STORE_MAX_ENTRIES if max_entries is None else max_entries
+    if not os.path.isdir(STORE_DIR):
+        return 0
+    # Scanning the directory (not an in-process index) keeps prefork workers consistent
+    entries = {}
+    for entry in os.scandir(STORE_DIR):
+        if entry.is_file() and entry.name.endswith(".png"):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            key = entry.name.split("_", 1)[0]
+            entries[key] = max(entries.get(key, 0.0), mtime)
+    doomed = sorted(entries, key=entries.get)[:max(0, len(entries) - max_entries)]
+    for key in doomed:
+        for path in _paths(key).values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(doomed)
+
+
+class ResultCache:
+    def __init__(self, capacity=RESULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._writes = queue.Queue(STORE_QUEUE_SIZE)
+        self._writer = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0, "store_skipped": 0, "evicted": 0}
+
+    def _remember(self, key, outputs):
+        # Shared between requests from now on
+        for array in outputs.values():
+            array.setflags(write=False)
+        with self._lock:
+            self._entries[key] = outputs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def _load(self, key):
+        paths = _paths(key)
+        if not all(os.path.exists(p) for p in paths.values()):
+            return None
+        try:
+            with span("mask_io"):
+                outputs = {name: np.asarray(Image.open(p).convert("L")) for name, p in paths.items()}
+            # Recently used for prune_store
+            os.utime(paths["depth"])
+            return outputs
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, outputs):
+        """Queue `outputs` for the background writer; skipped when it is behind."""
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="result-store", daemon=True)
+                self._writer.start()
+        try:
+            self._writes.put_nowait((key, outputs))
+        except queue.Full:
+            with self._lock:
+                self.stats["store_skipped"] += 1
+
+    def _write_loop(self):
+        while True:
+            key, outputs = self._writes.get()
+            try:
+                os.makedirs(STORE_DIR, exist_ok=True)
+                for name, path in _paths(key).items():
+                    _write_atomic(outputs[name], path)
+                with self._lock:
+                    self.stats["stored"] += 1
+                    prune = self.stats["stored"] % PRUNE_EVERY == 0
+                if prune:
+                    evicted = prune_store()
+                    with self._lock:
+                        self.stats["evicted"] += evicted
+            except Exception as e:
+                print(f"⚠️ Result store write failed: {e}")
+            finally:
+                self._writes.task_done()
+
+    def flush(self):
+        """Block until queued writes are on disk (tests, benchmarks)."""
+        self._writes.join()
+
+    def get_or_compute(self, frame, compute, persist=True):
+        """
+        Outputs for `frame`: {"depth": (H, W) uint8, 1: mask, 2: mask, 18: mask}.
+
+        `compute(frame)` runs the models on a miss. Frames without a digest
+        (nothing to address them by) are always computed.
+        """
+        if frame.digest is None:
+            return compute(frame)
+        key = cache_key(frame.digest)
+
+        while True:
+            with self._lock:
+                outputs = self._entries.get(key)
+                if outputs is not None:
+                    self._entries.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return outputs
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    break
+            waiter.wait()
+
+        try:
+            outputs = self._load(key) if persist else None
+            if outputs is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+            else:
+                outputs = compute(frame)
+                with self._lock:
+                    self.stats["misses"] += 1
+                if persist:
+                    self._store(key, outputs)
+            self._remember(key, outputs)
+            return outputs
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def info(self):
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.capacity, **self.stats}
+
+
+result_cache = ResultCache()
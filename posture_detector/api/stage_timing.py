@@ -0,0 +1,122 @@
+"""
+Per-stage latency histograms for the metrics pipeline.
+
+Wrap each stage in `with span("depth_inference"):` and scrape
+`render_prometheus()` (served at /metrics by get_metrics.py).
+Histograms are per process; in prefork mode every worker keeps its own.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; model stages sit in the 0.1-5s range on CPU
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGES = (
+    "frame_lookup",
+    "image_decode",
+    "cascade_check",
+    "depth_inference",
+    "segmentation_inference",
+    "upsample_argmax",
+    "mask_io",
+    "metric_math",
+    "request_total",
+)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        out = []
+        for n in self.counts:
+            running += n
+            out.append(running)
+        return out
+
+
+_lock = threading.Lock()
+_histograms = {stage: Histogram() for stage in STAGES}
+# Optional stage -> context manager (or None); profiling.py uses it for torch traces
+_stage_wrapper = None
+
+
+def set_stage_wrapper(wrapper):
+    global _stage_wrapper
+    _stage_wrapper = wrapper
+
+
+def observe(stage, seconds):
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+
+
+@contextmanager
+def span(stage):
+    wrapper = _stage_wrapper(stage) if _stage_wrapper is not None else None
+    start = time.perf_counter()
+    try:
+        if wrapper is None:
+            yield
+        else:
+            with wrapper:
+                yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def snapshot():
+    """Stage -> {count, sum, mean} for quick inspection and benchmarks."""
+    with _lock:
+        return {
+            stage: {
+                "count": h.count,
+                "sum": round(h.total, 6),
+                "mean": round(h.total / h.count, 6) if h.count else 0.0,
+            }
+            for stage, h in _histograms.items()
+        }
+
+
+def reset():
+    with _lock:
+        for stage in list(_histograms):
+            _histograms[stage] = Histogram()
+
+
+def _fmt(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def render_prometheus(name="posture_stage_seconds"):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = [
+        f"# HELP {name} Time spent in each posture metrics pipeline stage.",
+        f"# TYPE {name} histogram",
+    ]
+    with _lock:
+        for stage, h in _histograms.items():
+            for bound, n in zip(h.buckets, h.cumulative()):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{_fmt(bound)}"}} {n}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {h.total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+    return "\n".join(lines) + "\n"
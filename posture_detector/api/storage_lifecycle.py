@@ -0,0 +1,265 @@
+"""
+Retention and compaction for session frames, face artifacts and posture logs.
+
+Without this, storage/sessions/*/frames, ../face and api/logs grow forever and
+get_most_recent_dir/get_most_recent_file slow down as directory listings grow.
+One sweep:
+
+    1. archives the frames of idle sessions into storage/sessions/{id}/frames.zip
+    2. deletes whole sessions by age, then by count, then by total size (oldest first)
+    3. deletes ../face PNGs once the metrics that produced them are done
+    4. deletes old posture_*.log files
+
+The session currently receiving frames is never touched. Retention deletes
+data, so it is opt-in: `STORAGE_LIFECYCLE=1 python app.py` runs it in the
+dashboard process, or run it by hand:
+
+    python storage_lifecycle.py --report
+    python storage_lifecycle.py --once
+"""
+
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+SESSIONS_DIR = BASE_DIR.parent / "storage" / "sessions"
+FACE_DIR = BASE_DIR.parent / "face"
+LOG_DIR = BASE_DIR / "logs"
+
+# Retention policy (env overrides); matches AppConfig.session.maxSessionAge
+MAX_SESSION_AGE_DAYS = float(os.environ.get("MAX_SESSION_AGE_DAYS", "7"))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "50"))
+MAX_STORAGE_MB = float(os.environ.get("MAX_STORAGE_MB", "2048"))
+ARCHIVE_AFTER_MINUTES = float(os.environ.get("ARCHIVE_AFTER_MINUTES", "30"))
+FACE_ARTIFACT_TTL_SECONDS = float(os.environ.get("FACE_ARTIFACT_TTL_SECONDS", "600"))
+MAX_LOG_AGE_DAYS = float(os.environ.get("MAX_LOG_AGE_DAYS", "30"))
+MAX_LOG_FILES = int(os.environ.get("MAX_LOG_FILES", "20"))
+ACTIVE_WINDOW_SECONDS = 300
+SWEEP_INTERVAL_SECONDS = 300
+# app.py only starts the background sweeper when this is set
+STORAGE_LIFECYCLE = os.environ.get("STORAGE_LIFECYCLE", "0") == "1"
+
+ARCHIVE_NAME = "frames.zip"
+
+
+def _tree_stats(path):
+    files = 0
+    size = 0
+    latest = 0.0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            files += 1
+            size += st.st_size
+            latest = max(latest, st.st_mtime)
+    return files, size, latest
+
+
+def session_usage(sessions_dir=None):
+    """Per-session disk usage, newest first."""
+    sessions_dir = sessions_dir or SESSIONS_DIR
+    sessions = []
+    if not sessions_dir.is_dir():
+        return sessions
+    for entry in os.scandir(sessions_dir):
+        if not entry.is_dir():
+            continue
+        session = Path(entry.path)
+        frames, frame_bytes, latest = _tree_stats(session / "frames")
+        archive = session / ARCHIVE_NAME
+        archived = archive.stat().st_size if archive.exists() else 0
+        total_files, total_bytes, total_latest = _tree_stats(session)
+        sessions.append({
+            "session": entry.name,
+            "frames": frames,
+            "frame_bytes": frame_bytes,
+            "archive_bytes": archived,
+            "bytes": total_bytes,
+            "last_modified": max(latest, total_latest, entry.stat().st_mtime),
+        })
+    sessions.sort(key=lambda s: s["last_modified"], reverse=True)
+    return sessions
+
+
+def disk_usage():
+    sessions = session_usage()
+    face_files, face_bytes, _ = _tree_stats(FACE_DIR)
+    log_files, log_bytes, _ = _tree_stats(LOG_DIR)
+    return {
+        "sessions": sessions,
+        "sessions_bytes": sum(s["bytes"] for s in sessions),
+        "face": {"files": face_files, "bytes": face_bytes},
+        "logs": {"files": log_files, "bytes": log_bytes},
+    }
+
+
+def archive_session(session_dir):
+    """Move loose frames into frames.zip (stored, JPEGs don't compress) and drop the directory."""
+    frames_dir = session_dir / "frames"
+    if not frames_dir.is_dir():
+        return 0
+    names = sorted(f.name for f in frames_dir.iterdir() if f.is_file())
+    if not names:
+        return 0
+    # Archiving must not make the session look new: get_depth picks the live
+    # session by directory mtime, and retention ages sessions by their newest file
+    session_mtime = session_dir.stat().st_mtime
+    newest_frame = max((frames_dir / name).stat().st_mtime for name in names)
+    archive = session_dir / ARCHIVE_NAME
+    tmp = archive.with_suffix(".zip.tmp")
+    if archive.exists():
+        shutil.copyfile(archive, tmp)
+    with zipfile.ZipFile(tmp, "a", compression=zipfile.ZIP_STORED) as zf:
+        existing = set(zf.namelist())
+        for name in names:
+            if name not in existing:
+                zf.write(frames_dir / name, arcname=name)
+    os.replace(tmp, archive)
+    shutil.rmtree(frames_dir)
+    os.utime(archive, (newest_frame, newest_frame))
+    os.utime(session_dir, (session_mtime, session_mtime))
+    return len(names)
+
+
+def sweep_sessions(now=None, dry_run=False):
+    now = now or time.time()
+    sessions = session_usage()
+    actions = {"archived": [], "deleted": []}
+    if not sessions:
+        return actions
+
+    # The newest session (or any touched very recently) is live
+    live = {sessions[0]["session"]} | {
+        s["session"] for s in sessions if now - s["last_modified"] < ACTIVE_WINDOW_SECONDS
+    }
+
+    keep = []
+    for s in sessions:
+        if s["session"] in live:
+            keep.append(s)
+            continue
+        if now - s["last_modified"] > MAX_SESSION_AGE_DAYS * 86400:
+            actions["deleted"].append(s["session"])
+            continue
+        keep.append(s)
+
+    # Count, then size: drop oldest non-live sessions until within limits
+    total = sum(s["bytes"] for s in keep)
+    for s in reversed(keep[:]):
+        if s["session"] in live:
+            continue
+        if len(keep) <= MAX_SESSIONS and total <= MAX_STORAGE_MB * 1024 * 1024:
+            break
+        keep.remove(s)
+        total -= s["bytes"]
+        actions["deleted"].append(s["session"])
+
+    for s in keep:
+        if s["session"] not in live and s["frames"] and now - s["last_modified"] > ARCHIVE_AFTER_MINUTES * 60:
+            actions["archived"].append(s["session"])
+
+    if not dry_run:
+        for name in actions["deleted"]:
+            shutil.rmtree(SESSIONS_DIR / name, ignore_errors=True)
+        for name in actions["archived"]:
+            try:
+                archive_session(SESSIONS_DIR / name)
+            except Exception as e:
+                print(f"[STORAGE] Failed to archive {name}: {e}")
+    return actions
+
+
+def sweep_face_artifacts(now=None, dry_run=False):
+    """
+    Delete ../face PNGs older than FACE_ARTIFACT_TTL_SECONDS; metrics are computed from memory.
+
+    Only intermediate artifacts live there. result_cache keeps its store in
+    ../storage/results and bounds it itself.
+    """
+    now = now or time.time()
+    removed = 0
+    if not FACE_DIR.is_dir():
+        return removed
+    for entry in os.scandir(FACE_DIR):
+        if entry.is_file() and entry.name.endswith(".png") and now - entry.stat().st_mtime > FACE_ARTIFACT_TTL_SECONDS:
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+    return removed
+
+
+def sweep_logs(now=None, keep=(), dry_run=False):
+    now = now or time.time()
+    if not LOG_DIR.is_dir():
+        return []
+    logs = sorted(
+        (p for p in LOG_DIR.glob("posture_*.log") if p not in keep),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    # Logs are per day, user and process (see app.log_posture); the count limit
+    # only applies to files not written to in the last day
+    doomed = [p for i, p in enumerate(logs)
+              if now - p.stat().st_mtime > MAX_LOG_AGE_DAYS * 86400
+              or (i >= MAX_LOG_FILES and now - p.stat().st_mtime > 86400)]
+    if not dry_run:
+        for p in doomed:
+            p.unlink(missing_ok=True)
+    return [p.name for p in doomed]
+
+
+def sweep(keep_logs=(), dry_run=False):
+    now = time.time()
+    result = sweep_sessions(now, dry_run)
+    result["face_removed"] = sweep_face_artifacts(now, dry_run)
+    result["logs_removed"] = sweep_logs(now, keep=keep_logs, dry_run=dry_run)
+    return result
+
+
+_thread = None
+
+
+def start_lifecycle_thread(keep_logs=(), interval=SWEEP_INTERVAL_SECONDS):
+    """Run sweep() every `interval` seconds in a daemon thread."""
+    global _thread
+
+    def _run():
+        while True:
+            try:
+                result = sweep(keep_logs=keep_logs)
+                if result["archived"] or result["deleted"] or result["face_removed"] or result["logs_removed"]:
+                    print(f"[STORAGE] Sweep: {result}")
+            except Exception as e:
+                print("[STORAGE] Sweep error:", e)
+            time.sleep(interval)
+
+    if _thread is None:
+        _thread = threading.Thread(target=_run, name="storage-lifecycle", daemon=True)
+        _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Storage lifecycle for sessions, face artifacts and logs")
+    parser.add_argument("--report", action="store_true", help="Print disk usage per session")
+    parser.add_argument("--once", action="store_true", help="Run one sweep and exit")
+    parser.add_argument("--dry-run", action="store_true", help="Show what a sweep would do")
+    args = parser.parse_args()
+
+    if args.report or not (args.once or args.dry_run):
+        print(json.dumps(disk_usage(), indent=2))
+    if args.once or args.dry_run:
+        print(json.dumps(sweep(dry_run=args.dry_run), indent=2))
@@ -0,0 +1,258 @@
+"""
+Streaming frame ingest for the posture pipeline.
+
+Instead of uploading a JPEG per capture to /api/upload-frame and letting the
+metrics service rediscover it on disk, clients keep a Socket.IO connection
+open and push frames as binary messages:
+
+    socket.emit("frame", {sessionId, frameNumber, format: "jpeg"}, jpegBytes)
+    socket.emit("frame", {sessionId, frameNumber, format: "raw", width, height}, rgbBytes)
+
+Frames are decoded in memory and go straight onto a bounded inference queue.
+When the queue is full the oldest frame is dropped, because only the latest
+posture matters. Each result is sent back to the sender as a "metrics" event.
+
+A local MJPEG source (file or http URL) can stand in for a camera:
+
+    python stream_ingest.py --mjpeg capture.mjpeg --session demo --fps 2
+
+Without --fps the source is read as fast as it decodes, which is usually far
+faster than inference, so the latest-wins queue drops most frames. Drops are
+counted (ingest_mjpeg's return value, "dropped" in /api/stream/stats) and
+logged.
+"""
+
+import threading
+import time
+import urllib.request
+from collections import deque
+
+from flask import Flask, jsonify, request
+from flask_cors import CORS
+from flask_socketio import SocketIO
+
+from frame_cache import decode_frame_bytes, frame_from_raw
+from profiling import register_profiling
+
+STREAM_QUEUE_SIZE = 4
+
+app = Flask(__name__)
+CORS(app)
+register_profiling(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+
+
+class InferenceQueue:
+    """Bounded latest-wins queue drained by worker threads."""
+
+    def __init__(self, handler, maxsize=STREAM_QUEUE_SIZE, workers=1):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"inference-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def submit(self, job):
+        """Queue `job`; returns False if an older job had to be dropped for it."""
+        with self._cond:
+            dropped = False
+            while len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                dropped = True
+            self._items.append(job)
+            self.submitted += 1
+            self._cond.notify()
+        return not dropped
+
+    def depth(self):
+        with self._cond:
+            return len(self._items)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "capacity": self.maxsize,
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._items:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                job = self._items.popleft()
+            try:
+                self.handler(job)
+                with self._cond:
+                    self.processed += 1
+            except Exception as e:
+                with self._cond:
+                    self.failed += 1
+                print(f"[STREAM] Inference failed for {job.get('session_id')}#{job.get('frame_number')}: {e}")
+
+
+def process_job(job):
+    from get_metrics import compute_metrics
+    from posture_tracker import get_tracker
+    from calibration import get_calibration
+
+    tracker = get_tracker(job["session_id"])
+    calibration = get_calibration(job["session_id"])
+    metrics = compute_metrics(job["id"], job["frame"], save_artifacts=False, tracker=tracker, calibration=calibration)
+    metrics["frame_number"] = job["frame_number"]
+    metrics["latency_ms"] = round((time.perf_counter() - job["received"]) * 1000, 1)
+    job["reply"](metrics)
+
+
+inference_queue = InferenceQueue(process_job)
+
+
+def make_job(session_id, frame_number, frame, reply):
+    return {
+        "id": f"{session_id}_{frame_number}",
+        "session_id": session_id,
+        "frame_number": frame_number,
+        "frame": frame,
+        "received": time.perf_counter(),
+        "reply": reply,
+    }
+
+
+def decode_message(meta, data):
+    name = f"stream:{meta.get('sessionId')}/{meta.get('frameNumber')}"
+    if meta.get("format", "jpeg") == "raw":
+        return frame_from_raw(data, int(meta["width"]), int(meta["height"]), name)
+    return decode_frame_bytes(data, name)
+
+
+@socketio.on("frame")
+def on_frame(meta, data):
+    sid = request.sid
+    session_id = meta.get("sessionId", sid)
+    frame_number = meta.get("frameNumber", 0)
+    try:
+        frame = decode_message(meta, data)
+    except Exception as e:
+        socketio.emit("stream_error", {"frameNumber": frame_number, "error": str(e)}, to=sid)
+        return {"accepted": False}
+
+    def reply(metrics):
+        socketio.emit("metrics", metrics, to=sid)
+
+    accepted = inference_queue.submit(make_job(session_id, frame_number, frame, reply))
+    return {"accepted": True, "queue_depth": inference_queue.depth(), "dropped_older": not accepted}
+
+
+@app.route("/api/stream/stats", methods=["GET"])
+def stream_stats():
+    return jsonify(inference_queue.stats())
+
+
+# ---------------------------------------------------------------------------
+# MJPEG stand-in source
+# ---------------------------------------------------------------------------
+
+def split_mjpeg(stream, chunk_size=64 * 1024):
+    """Yield JPEG byte strings from an MJPEG byte stream (SOI..EOI markers)."""
+    buf = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            if start < 0:
+                buf = buf[-1:]
+                break
+            end = buf.find(b"\xff\xd9", start + 2)
+            if end < 0:
+                buf = buf[start:]
+                break
+            yield buf[start:end + 2]
+            buf = buf[end + 2:]
+
+
+def ingest_mjpeg(source, session_id, reply, fps=None):
+    """
+    Feed frames from an MJPEG file or http URL into the inference queue.
+
+    Returns {"frames", "dropped"}: frames read, and older frames the queue
+    dropped to make room for them (unpaced sources outrun inference).
+    """
+    stream = urllib.request.urlopen(source) if source.startswith(("http://", "https://")) else open(source, "rb")
+    interval = 1.0 / fps if fps else 0
+    counts = {"frames": 0, "dropped": 0}
+    with stream:
+        for n, jpeg in enumerate(split_mjpeg(stream), start=1):
+            frame = decode_frame_bytes(jpeg, f"mjpeg:{session_id}/{n}")
+            counts["frames"] = n
+            if not inference_queue.submit(make_job(session_id, n, frame, reply)):
+                counts["dropped"] += 1
+                if counts["dropped"] == 1 and not interval:
+                    print("[STREAM] Queue full, dropping older MJPEG frames; pass --fps to pace the source")
+            if interval:
+                time.sleep(interval)
+    print(f"[STREAM] MJPEG source finished: {counts['frames']} frames, {counts['dropped']} dropped; {inference_queue.stats()}")
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    from get_depth import warm_up
+
+    parser = argparse.ArgumentParser(description="Streaming frame ingest")
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument("--workers", type=int, default=1, help="Inference worker threads")
+    parser.add_argument("--queue-size", type=int, default=STREAM_QUEUE_SIZE)
+    parser.add_argument("--mjpeg", help="Local MJPEG file or http URL to ingest instead of waiting for clients")
+    parser.add_argument("--session", default="mjpeg")
+    parser.add_argument("--fps", type=float, default=None, help="Pace the MJPEG source (default: as fast as possible, dropping what inference can't keep up with)")
+    args = parser.parse_args()
+
+    inference_queue.maxsize = args.queue_size
+    inference_queue.workers = args.workers
+    warm_up(background=False)
+    inference_queue.start()
+
+    if args.mjpeg:
+        ingest_mjpeg(args.mjpeg, args.session, lambda m: print(f"[STREAM] {m}"), fps=args.fps)
+        while inference_queue.depth():
+            time.sleep(0.1)
+        inference_queue.stop()
+    else:
+        print(f"✅ Stream ingest listening on http://localhost:{args.port}")
+        socketio.run(app, host="0.0.0.0", port=args.port, allow_unsafe_werkzeug=True)
@@ -0,0 +1,92 @@
+"""
+Test that the declarative feedback rules match the scalar if-chains they replaced
+"""
+import sys
+sys.path.insert(0, '.')
+
+import time
+
+import numpy as np
+
+from ai_feedback import generate_fallback_feedback
+from feedback_rules import (FEEDBACK_RULES, POSTURE_RULES, evaluate_feedback, evaluate_posture,
+                            render_feedback, score_records, severity_counts)
+from get_metrics import is_correct
+
+SAMPLES = 10000
+
+
+def random_columns(n=SAMPLES, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "torsion_angle": rng.uniform(0, 40, n),
+        "depth_diff": rng.uniform(-0.1, 0.3, n),
+        "face_angle": rng.uniform(-30, 30, n),
+        "face_yaw_angle": rng.uniform(-40, 40, n),
+        "eye_strain": rng.uniform(0, 10, n),
+        "neck_strain": rng.uniform(0, 10, n),
+        "chest_roll": rng.uniform(0, 20, n),
+        "chest_pitch": rng.uniform(0, 20, n),
+    }
+
+
+def threshold_columns():
+    # Every rule's metric exactly at, just under and just over its threshold (both signs for abs_gt)
+    values = {}
+    for rule in FEEDBACK_RULES + POSTURE_RULES:
+        t = rule["threshold"]
+        values.setdefault(rule["metric"], set()).update({t, t - 1e-9, t + 1e-9, -t, 0.0})
+    metrics = sorted(values)
+    grids = np.meshgrid(*[sorted(values[m]) for m in metrics[:4]], indexing="ij")
+    n = grids[0].size
+    rng = np.random.default_rng(1)
+    columns = {m: g.ravel() for m, g in zip(metrics[:4], grids)}
+    for m in metrics[4:]:
+        columns[m] = rng.choice(sorted(values[m]), n)
+    return columns
+
+
+def to_records(columns):
+    n = len(next(iter(columns.values())))
+    return [{k: float(v[i]) for k, v in columns.items()} for i in range(n)]
+
+
+def check_parity(columns):
+    records = to_records(columns)
+    correct, _ = evaluate_posture(columns)
+    fired = evaluate_feedback(columns)
+    messages = render_feedback(fired, columns)
+    for c, m, r in zip(correct, messages, records):
+        assert bool(c) == is_correct(r), f"posture differs for {r}"
+        assert m == generate_fallback_feedback(r), f"feedback differs for {r}"
+    return fired
+
+
+def test_random_samples_match_scalar_rules():
+    check_parity(random_columns())
+
+
+def test_thresholds_match_scalar_rules():
+    check_parity(threshold_columns())
+
+
+def test_score_records_matches_scalar_rules():
+    records = to_records(random_columns(500, seed=2))
+    for scored, r in zip(score_records(records), records):
+        assert scored == {"posture": int(is_correct(r)), "feedback": generate_fallback_feedback(r)}
+
+
+if __name__ == "__main__":
+    columns = random_columns()
+    start = time.perf_counter()
+    evaluate_posture(columns)
+    evaluate_feedback(columns)
+    print(f"✓ Rules evaluated for {SAMPLES} samples in {(time.perf_counter() - start) * 1000:.1f} ms")
+    try:
+        fired = check_parity(columns)
+        test_thresholds_match_scalar_rules()
+        test_score_records_matches_scalar_rules()
+    except AssertionError as e:
+        print(f"\n❌ FAILED! {e}")
+        sys.exit(1)
+    print(f"\n✅ SUCCESS! Matches scalar rules; severity counts: {severity_counts(fired)}")
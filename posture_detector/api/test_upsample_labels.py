@@ -0,0 +1,50 @@
+"""
+Test that banded upsample_labels gives the same labels as upsampling the whole tensor
+"""
+import sys
+sys.path.insert(0, '.')
+
+import get_depth
+from get_depth import upsample_labels, UPSAMPLE_BAND_ROWS
+
+get_depth.load_backend()
+torch = get_depth.torch
+
+# (logit h, logit w, frame H, frame W); heights include ones that aren't a
+# multiple of UPSAMPLE_BAND_ROWS, are shorter than one band, or are upscaled
+SHAPES = [
+    (128, 128, 480, 640),
+    (128, 128, 720, 1280),
+    (128, 128, 100, 90),
+    (64, 48, 33, 47),
+    (128, 128, UPSAMPLE_BAND_ROWS, 64),
+    (128, 128, UPSAMPLE_BAND_ROWS + 1, 64),
+    (16, 16, 1, 5),
+    (16, 16, 250, 250),
+]
+
+
+def full_upsample(logits, size):
+    full = torch.nn.functional.interpolate(logits, size=size, mode='bilinear', align_corners=False)
+    return full.argmax(dim=1)[0].numpy()
+
+
+def test_banded_matches_full():
+    generator = torch.Generator().manual_seed(0)
+    for h, w, height, width in SHAPES:
+        logits = torch.randn(1, 19, h, w, generator=generator)
+        banded = upsample_labels(logits, (height, width))
+        full = full_upsample(logits, (height, width))
+        assert banded.shape == (height, width)
+        assert banded.dtype.name == "uint8"
+        mismatched = int((banded != full).sum())
+        assert mismatched == 0, f"{mismatched} labels differ at {height}x{width} from {h}x{w} logits"
+
+
+if __name__ == "__main__":
+    try:
+        test_banded_matches_full()
+    except AssertionError as e:
+        print(f"\n❌ FAILED! Banded upsampling differs from the full tensor: {e}")
+        sys.exit(1)
+    print(f"\n✅ SUCCESS! Banded upsampling matches the full tensor for {len(SHAPES)} shapes")
@@ -19,6 +19,7 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const frameIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const frameCountRef = useRef<number>(0);
   const lastNotificationTimeRef = useRef<number>(0);
   const lastVoiceAlertTimeRef = useRef<number>(0);
   const isPlayingAudioRef = useRef<boolean>(false);
@@ -36,8 +37,12 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
   const [aiFeedback, setAiFeedback] = useState<string>('');
   const [feedbackLoading, setFeedbackLoading] = useState(false);
   const [lastMetrics, setLastMetrics] = useState<any>(null);
+  const [captureTick, setCaptureTick] = useState(0);
 
   const CAPTURE_INTERVAL_MS = AppConfig.recording.captureIntervalSeconds * 1000;
+  const MIN_CAPTURE_INTERVAL_MS = AppConfig.recording.minCaptureIntervalSeconds * 1000;
+  const MAX_CAPTURE_INTERVAL_MS = AppConfig.recording.maxCaptureIntervalSeconds * 1000;
+  const [captureIntervalMs, setCaptureIntervalMs] = useState(CAPTURE_INTERVAL_MS);
   const NOTIFICATION_COOLDOWN_MS = AppConfig.alerts.desktopNotification.cooldownSeconds * 1000;
   const VOICE_ALERT_COOLDOWN_MS = AppConfig.alerts.voiceAlert.cooldownSeconds * 1000;
   const tracks = useTracks([Track.Source.Camera]);
@@ -206,47 +211,11 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
     }
   };
 
-  const getAIFeedback = async (metrics: any): Promise<string> => {
+  const uploadFrame = async (frameData: string, frameNumber: number, isRetry = false) => {
     try {
-      console.log('🤖 Requesting AI feedback for metrics:', metrics);
-      setFeedbackLoading(true);
-      const response = await fetch('http://localhost:5001/api/ai_feedback', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(metrics),
-      });
-
-      console.log('📡 AI feedback response status:', response.status);
-
-      if (!response.ok) {
-        throw new Error(`AI feedback request failed: ${response.status}`);
-      }
-
-      const data = await response.json();
-      console.log('✅ AI feedback received:', data);
-      if (data.feedback) {
-        setAiFeedback(data.feedback);
-        console.log('💬 Set AI feedback to:', data.feedback);
-        return data.feedback;
-      }
-      return 'Please adjust your posture';
-    } catch (error) {
-      console.error('❌ Failed to get AI feedback:', error);
-      // Fallback to generic message
-      const fallbackMessage = 'Please adjust your posture';
-      setAiFeedback(fallbackMessage);
-      console.log('⚠️ Using fallback feedback');
-      return fallbackMessage;
-    } finally {
-      setFeedbackLoading(false);
-    }
-  };
-
-  const uploadFrame = async (frameData: string, frameNumber: number) => {
-    try {
-      const response = await fetch('/api/upload-frame', {
+      // One round trip: the metrics service stores the frame, scores it, logs it
+      // for the dashboard and, for bad posture, generates feedback server-side
+      const response = await fetch('http://localhost:5500/api/analyze', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -256,35 +225,53 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
           sessionId,
           frameNumber,
           timestamp: new Date().toISOString(),
+          // Posture is smoothed per session server-side; only ask for new feedback when it flips to bad
+          feedback: aiFeedback ? 'auto' : 'bad',
         }),
       });
 
       if (!response.ok) {
-        throw new Error('Upload failed');
+        throw new Error('Analyze failed');
       }
 
       const result = await response.json();
-      const metrics = await fetch('http://localhost:5500/api/get_metrics?id=' + frameNumber);
-      const metricsData = await metrics.json();
-      console.log('📊 Metrics received:', metricsData);
+      const metricsData = result.metrics;
+      console.log('📊 Metrics received:', metricsData, `(${result.latency_ms} ms)`);
+
+      // Server-paced capture: slower while posture is stable or the server is busy
+      if (AppConfig.recording.adaptiveCapture && typeof result.next_capture_seconds === 'number') {
+        const nextMs = Math.min(MAX_CAPTURE_INTERVAL_MS, Math.max(MIN_CAPTURE_INTERVAL_MS, result.next_capture_seconds * 1000));
+        if (nextMs !== captureIntervalMs) {
+          console.log(`⏱️ Next capture in ${nextMs / 1000}s (${result.capture_reason})`);
+        }
+        setCaptureIntervalMs(nextMs);
+      }
 
       // Store metrics for display
       setLastMetrics(metricsData);
       console.log('💾 Stored metrics in state');
 
-      // Log posture (don't let CORS errors crash the whole function)
-      // Ryan - calling dummy function 4
-      try {
-        await fetch('http://localhost:3500/api/app.py?' + "neck-strain=" + metricsData.neck_strain + "&eye-strain=" + metricsData.eye_strain + "&posture=" + metricsData.posture);
-      } catch (logError) {
-        console.warn('⚠️ Posture logging failed (non-critical):', logError);
+      // Masks too poor to trust (nothing was logged server-side): don't alert on them,
+      // try one fresh frame right away instead of waiting for the next interval
+      if (result.low_confidence) {
+        console.log(`🌫️ Low-confidence frame (${metricsData.confidence})` + (isRetry ? ', skipping' : ', retrying'));
+        if (!isRetry) {
+          const retryFrame = captureFrame();
+          if (retryFrame) {
+            uploadFrame(retryFrame, frameNumber, true);
+          }
+        }
+        return;
       }
 
       // Only get AI feedback for bad posture (posture === 0)
       // Don't show positive feedback - only alert when there's a problem
       if (metricsData.posture === 0) {
-        console.log('⚠️ Bad posture detected! Requesting AI feedback...');
-        const feedback = await getAIFeedback(metricsData);
+        if (result.feedback) {
+          setAiFeedback(result.feedback);
+        }
+        console.log('⚠️ Bad posture detected!' + (result.feedback ? ` New feedback (${result.feedback_source})` : ' Reusing last feedback'));
+        const feedback = result.feedback || aiFeedback;
 
         // Show desktop notification with AI feedback
         showDesktopNotification(feedback || 'Please adjust your posture');
@@ -316,7 +303,7 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
         window.dispatchEvent(event);
       }
 
-      console.log(`✅ Frame ${frameNumber} uploaded:`, result.filename);
+      console.log(`✅ Frame ${frameNumber} analyzed`);
       setUploadedCount(prev => prev + 1);
       
     } catch (error) {
@@ -327,22 +314,26 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
 
   useEffect(() => {
     if (isCapturing && isConnected && !isPaused) {
-      frameIntervalRef.current = setInterval(() => {
+      // One frame in flight at a time: the next capture is scheduled once this
+      // one has been answered, using the interval the server recommended
+      frameIntervalRef.current = setTimeout(async () => {
         const frame = captureFrame();
         if (frame) {
-          const currentFrameNumber = frameCount + 1;
+          const currentFrameNumber = frameCountRef.current + 1;
+          frameCountRef.current = currentFrameNumber;
           setFrameCount(currentFrameNumber);
-          uploadFrame(frame, currentFrameNumber);
+          await uploadFrame(frame, currentFrameNumber);
         }
-      }, CAPTURE_INTERVAL_MS);
+        setCaptureTick(prev => prev + 1);
+      }, captureIntervalMs);
 
       return () => {
         if (frameIntervalRef.current) {
-          clearInterval(frameIntervalRef.current);
+          clearTimeout(frameIntervalRef.current);
         }
       };
     }
-  }, [isCapturing, isConnected, isPaused, frameCount, CAPTURE_INTERVAL_MS]);
+  }, [isCapturing, isConnected, isPaused, captureTick]);
 
   useEffect(() => {
     if (isConnected && !isCapturing) {
@@ -450,7 +441,7 @@ export default function PosturePalRoom({ onStopRecording }: PosturePalRoomProps)
                     : 'bg-gradient-to-r from-purple-600 to-pink-600'
                 }`}>
                   <div className="w-2 h-2 bg-white rounded-full animate-pulse"></div>
-                  <span>{isPaused ? 'PAUSED' : `CAPTURING (1 frame / ${AppConfig.recording.captureIntervalSeconds}s)`}</span>
+                  <span>{isPaused ? 'PAUSED' : `CAPTURING (1 frame / ${Math.round(captureIntervalMs / 1000)}s)`}</span>
                 </div>
               )}
 
@@ -9,6 +9,9 @@ export const AppConfig = {
   // Recording Settings
   recording: {
     captureIntervalSeconds: 5, // Capture 1 frame every X seconds (30 = 1 frame per 30 seconds)
+    adaptiveCapture: true, // Follow the metrics server's next_capture_seconds (stable posture / busy server => slower)
+    minCaptureIntervalSeconds: 2, // Bounds for the server-recommended interval
+    maxCaptureIntervalSeconds: 30,
     maxSessionDuration: 7200, // Maximum session duration in seconds (2 hours)
     autoSaveInterval: 5, // Auto-save interval in seconds
   },